@@ -0,0 +1,69 @@
+import json
+import socket
+from pathlib import Path
+
+# arguments of get_word_segments.py that are paths, which are sent as absolute
+# paths, since the server does not run in the directory of the client
+PATH_ARGUMENTS = [
+    "path_to_wav",
+    "path_to_txt",
+    "path_to_yaml",
+    "path_to_output_dir",
+    "emission_cache_dir",
+    "alignment_store_dir",
+    "text_cache_dir",
+    "onnx_dir",
+]
+
+
+def send_message(conn: socket.socket, message: dict):
+    """sends a message as a line of json"""
+    conn.sendall(json.dumps(message).encode() + b"\n")
+
+
+def receive_message(conn_file) -> dict:
+    """reads a message sent with "send_message" (None if the connection is closed)"""
+    line = conn_file.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def request_alignment(socket_path: str, job: dict) -> dict:
+    """sends a job to the alignment server and waits until it is done,
+    printing the output of the server for the job
+
+    Args:
+        socket_path (str): path to the unix socket of the server
+        job (dict): the arguments of get_word_segments.py
+
+    Raises:
+        RuntimeError: if the job failed in the server
+
+    Returns:
+        dict: the response of the server
+    """
+    job = {
+        key: (
+            str(Path(value).resolve())
+            if key in PATH_ARGUMENTS and value is not None
+            else value
+        )
+        for key, value in job.items()
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        send_message(conn, job)
+        with conn.makefile("r") as conn_file:
+            while True:
+                response = receive_message(conn_file)
+                if response is None:
+                    raise RuntimeError("The alignment server closed the connection")
+                if "log" in response:
+                    print(response["log"], end="", flush=True)
+                    continue
+                if not response["ok"]:
+                    raise RuntimeError(
+                        f"Failed job in the server:\n{response['error']}"
+                    )
+                return response
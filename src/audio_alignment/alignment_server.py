@@ -0,0 +1,145 @@
+import argparse
+import os
+import socket
+import socketserver
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+import get_word_segments
+import nltk
+import torch
+from alignment_client import receive_message, send_message
+from constants import LANG_CODES
+from onnx_model import DEFAULT_ONNX_DIR
+
+
+class SocketLog:
+    def __init__(self, conn: socket.socket):
+        """file-like object that sends the output of a job to its client
+        (the output of the processes forked by the job goes to the server)"""
+        self.conn = conn
+        self.pid = os.getpid()
+
+    def write(self, text: str) -> int:
+        if os.getpid() != self.pid:
+            return sys.__stderr__.write(text)
+        if text:
+            send_message(self.conn, {"log": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+class AlignmentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        """runs a job (the arguments of get_word_segments.py) with a warm model"""
+        job = receive_message(self.rfile)
+        if job is None:
+            return
+        args = argparse.Namespace(**job)
+        print(f"Job: {args.path_to_yaml} -> {args.path_to_output_dir}")
+
+        log = SocketLog(self.request)
+        try:
+            with redirect_stdout(log), redirect_stderr(log):
+                get_word_segments.get_word_segments(args, self.server.get_model(args))
+        except Exception:
+            print(f"Failed job: {args.path_to_yaml}")
+            send_message(self.request, {"ok": False, "error": traceback.format_exc()})
+        else:
+            print(f"Finished job: {args.path_to_yaml}")
+            send_message(self.request, {"ok": True})
+
+
+class AlignmentServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str):
+        """serves the jobs of get_word_segments.py --socket, one at a time,
+        with the models that were loaded by the previous jobs
+
+        Args:
+            socket_path (str): path of the unix socket
+        """
+        self.device = (
+            torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        )
+        self.models = {}
+        super().__init__(socket_path, AlignmentHandler)
+
+    def get_model(self, args: argparse.Namespace) -> tuple:
+        """(model, tokenizer, processor) for the language and model options of a job,
+        which are loaded the first time they are needed"""
+        key = (
+            args.language_code,
+            args.precision,
+            args.backend,
+            args.onnx_dir,
+            args.intra_op_threads,
+            args.inter_op_threads,
+        )
+        if key not in self.models:
+            print(f"Loading the model of {args.language_code} ({args.precision})")
+            self.models[key] = get_word_segments.load_model(
+                args.language_code,
+                self.device,
+                precision=args.precision,
+                backend=args.backend,
+                onnx_dir=args.onnx_dir,
+                intra_op_threads=args.intra_op_threads,
+                inter_op_threads=args.inter_op_threads,
+            )
+            # the sentence tokenizer of the text cleaning is loaded on its first use
+            nltk.sent_tokenize("", language=LANG_CODES[args.language_code])
+        return self.models[key]
+
+
+def serve(socket_path: str, languages: list[str]):
+    """starts the alignment server, with the default models of some languages
+    already loaded, until it is interrupted"""
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            try:
+                conn.connect(socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left by a server that did not exit cleanly
+                os.unlink(socket_path)
+            else:
+                raise RuntimeError(f"A server is already listening on {socket_path}")
+
+    server = AlignmentServer(socket_path)
+    try:
+        for language_code in languages:
+            server.get_model(
+                argparse.Namespace(
+                    language_code=language_code,
+                    precision="fp32",
+                    backend="torch",
+                    onnx_dir=str(Path(DEFAULT_ONNX_DIR).resolve()),
+                    intra_op_threads=None,
+                    inter_op_threads=None,
+                )
+            )
+        print(f"Listening on {socket_path}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="keeps the wav2vec2.0 models warm and runs the jobs of "
+        "get_word_segments.py --socket"
+    )
+    parser.add_argument("--socket", type=str, required=True)
+    parser.add_argument("--languages", "-lang", type=str, nargs="*", default=[])
+    args = parser.parse_args()
+
+    serve(args.socket, args.languages)
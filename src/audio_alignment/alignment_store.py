@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+# part of the keys, to invalidate the store if the format of the outputs changes
+STORE_VERSION = 2
+
+
+def talk_key(
+    audio_digest: str, segments: list[dict], model_name: str, settings: dict
+) -> str:
+    """key of the forced-alignment of a talk, which changes with any of its inputs
+
+    Args:
+        audio_digest (str): digest of the wav file (from "file_digest")
+        segments (list[dict]): original segments of the talk (as in "load_data"),
+            with their offset, duration and source text
+        model_name (str): name of the model (with its precision and backend)
+        settings (dict): the options of get_word_segments.py that change the output
+
+    Returns:
+        str: sha1 of the inputs
+    """
+    content = json.dumps(
+        {
+            "version": STORE_VERSION,
+            "audio": audio_digest,
+            "segments": [
+                [sgm["offset"], sgm["duration"], sgm["text"]] for sgm in segments
+            ],
+            "model": model_name,
+            "settings": settings,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class AlignmentStore:
+    def __init__(self, store_dir: Path):
+        """content-addressed store of the outputs of get_word_segments.py, which
+        can be shared by several language pairs and datasets that contain the
+        same talks (with the same audio, segmentation and source text)
+
+        Args:
+            store_dir (Path): directory of the store
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.store_dir / key[:2] / f"{key}.json"
+
+    def restore(self, key: str, out_file: Path) -> bool:
+        """copies the stored output of a talk to out_file
+
+        Returns:
+            bool: False if the talk is not in the store
+        """
+        try:
+            shutil.copyfile(self._path(key), out_file)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, out_file: Path):
+        """stores the output of a talk (written to out_file)"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # copy and rename, for other processes that might be reading the store
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(out_file, tmp_path)
+        os.replace(tmp_path, path)
@@ -0,0 +1,153 @@
+import struct
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchaudio
+from constants import SR
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def memmap_pcm16(path_to_wav: Path) -> np.ndarray:
+    """memory-maps the samples of a 16-bit PCM wav file
+
+    Args:
+        path_to_wav (Path): path to the wav file
+
+    Raises:
+        ValueError: if the file is not a 16-bit PCM wav file
+
+    Returns:
+        np.ndarray: int16 array of shape (num_frames, num_channels)
+    """
+    file_size = Path(path_to_wav).stat().st_size
+    with open(path_to_wav, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path_to_wav} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path_to_wav} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                audio_format, num_channels, _, _, _, bits_per_sample = struct.unpack(
+                    "<HHIIHH", fmt[:16]
+                )
+                if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # the format code is the start of the sub-format GUID
+                    audio_format = struct.unpack("<H", fmt[24:26])[0]
+                if audio_format != WAVE_FORMAT_PCM or bits_per_sample != 16:
+                    raise ValueError(f"{path_to_wav} is not 16-bit PCM")
+                f.seek(chunk_size % 2, 1)
+
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path_to_wav} has no fmt chunk")
+                data_offset = f.tell()
+                # the size can be wrong in files that were written as a stream
+                data_size = min(chunk_size, file_size - data_offset)
+                break
+
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    frame_size = 2 * num_channels
+    num_frames = data_size // frame_size
+    if num_frames == 0:
+        return np.zeros((0, num_channels), dtype=np.int16)
+    return np.memmap(
+        path_to_wav,
+        dtype="<i2",
+        mode="r",
+        offset=data_offset,
+        shape=(num_frames, num_channels),
+    )
+
+
+class TalkAudio:
+    def __init__(self, path_to_wav: Path):
+        """the audio of a talk, which is opened once and sliced into segments
+        without copying. 16-bit PCM wav files are memory-mapped, and any other
+        format is decoded once with sox.
+
+        Args:
+            path_to_wav (Path): path to the wav file
+        """
+        self.path_to_wav = path_to_wav
+        try:
+            self.samples = memmap_pcm16(path_to_wav)
+        except ValueError:
+            self.samples = (
+                torchaudio.backend.sox_io_backend.load(path_to_wav)[0].numpy().T
+            )
+
+    def segment(self, offset: float, duration: float) -> np.ndarray:
+        """returns a view on the samples of the first channel of a segment,
+        with the same frames as torchaudio.backend.sox_io_backend.load
+
+        Args:
+            offset (float): start of the segment in seconds
+            duration (float): duration of the segment in seconds
+
+        Returns:
+            np.ndarray: int16 (for memory-mapped files) or float32 samples
+        """
+        start = int(offset * SR)
+        return self.samples[start : start + int(duration * SR), 0]
+
+
+def to_float32(samples: np.ndarray) -> np.ndarray:
+    """converts the samples of a segment to float32 in [-1, 1), as sox does"""
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32)
+        samples /= 32768
+        return samples
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+
+class BatchBuilder:
+    def __init__(self):
+        """builds the padded input of wav2vec2.0 for a batch of audios in a buffer
+        that is reused across batches, with the same values as Wav2Vec2FeatureExtractor
+        (with do_normalize=True, padding_value=0.0 and return_attention_mask=True)"""
+        self.buffer = torch.empty(0)
+
+    def __call__(self, audios: list[np.ndarray]) -> tuple[torch.Tensor, torch.Tensor]:
+        """pads and normalizes a batch of audios
+
+        Args:
+            audios (list[np.ndarray]): int16 or float samples of each example,
+                which are converted as in "to_float32"
+
+        Returns:
+            tuple[torch.Tensor, torch.Tensor]: input values (a view on the buffer,
+            valid until the next call) and attention mask of the batch
+        """
+        lengths = torch.tensor([len(audio) for audio in audios])
+        batch_size, max_length = len(audios), int(lengths.max())
+        if self.buffer.numel() < batch_size * max_length:
+            self.buffer = torch.empty(batch_size * max_length)
+        input_values = self.buffer[: batch_size * max_length].view(
+            batch_size, max_length
+        )
+
+        for row, audio in zip(input_values.numpy(), audios):
+            samples = row[: len(audio)]
+            samples[:] = audio
+            if audio.dtype == np.int16:
+                samples /= 32768
+            # the same operations as Wav2Vec2FeatureExtractor.zero_mean_unit_var_norm
+            mean, std = samples.mean(), np.sqrt(samples.var() + 1e-7)
+            samples -= mean
+            samples /= std
+            row[len(audio) :] = 0.0
+
+        attention_mask = (torch.arange(max_length)[None, :] < lengths[:, None]).int()
+        return input_values, attention_mask
@@ -0,0 +1,674 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import forced_alignment
+import get_word_segments
+import numpy as np
+import text_cleaning
+import torch
+import torchaudio
+import yaml
+from audio_loading import BatchBuilder, TalkAudio, to_float32
+from constants import SR
+from fuzzywuzzy import fuzz
+from onnx_model import DEFAULT_ONNX_DIR, logits_parity
+
+
+def random_batch(
+    batch_size: int, num_frames: int, vocab_size: int, seed: int = 0
+) -> tuple[torch.Tensor, list[list[int]], list[int]]:
+    """creates a random batch of emissions and token ids,
+    with about one token every three frames (as in real speech)
+
+    Returns:
+        tuple[torch.Tensor, list[list[int]], list[int]]: emissions, tokens and
+        the number of valid frames of each example
+    """
+    generator = torch.Generator().manual_seed(seed)
+    emissions = torch.log_softmax(
+        torch.randn(batch_size, num_frames, vocab_size, generator=generator), dim=-1
+    )
+    frames = torch.randint(
+        num_frames // 2, num_frames + 1, (batch_size,), generator=generator
+    ).tolist()
+    frames[0] = num_frames
+    tokens = [
+        torch.randint(1, vocab_size, (f // 3,), generator=generator).tolist()
+        for f in frames
+    ]
+    return emissions, tokens, frames
+
+
+def bench_trellis(args):
+    emissions, tokens, frames = random_batch(
+        args.batch_size, args.num_frames, args.vocab_size
+    )
+    total_frames = sum(frames)
+
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        reference = [
+            forced_alignment.get_trellis(emission[:f], tkns)
+            for emission, tkns, f in zip(emissions, tokens, frames)
+        ]
+    elapsed = time.perf_counter() - start
+    print(f"{'loop':>10}: {args.repeats * total_frames / elapsed:12.0f} frames/s")
+
+    for backend in forced_alignment.TRELLIS_BACKENDS.keys():
+        # warm-up (numba compilation)
+        forced_alignment.get_trellis_batch(emissions, tokens, frames, backend=backend)
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            trellises = forced_alignment.get_trellis_batch(
+                emissions, tokens, frames, backend=backend
+            )
+        elapsed = time.perf_counter() - start
+
+        identical = all(torch.equal(t1, t2) for t1, t2 in zip(reference, trellises))
+        print(
+            f"{backend:>10}: {args.repeats * total_frames / elapsed:12.0f} frames/s"
+            f"\t(identical: {identical})"
+        )
+
+
+def load_examples(args, model, processor, vocab, device) -> list[tuple]:
+    """computes the emissions of the original segments of the first talks
+
+    Returns:
+        list[tuple]: (emission, tokens, tokenized_cleaned_txt) of each example
+    """
+    segments_per_talk = get_word_segments.load_data(args.path_to_yaml, args.path_to_txt)
+    examples = []
+    for talk_id in list(segments_per_talk.keys())[: args.num_talks]:
+        dataset = get_word_segments.WavDataset(
+            Path(args.path_to_wav) / f"{talk_id}.wav",
+            segments_per_talk[talk_id],
+            vocab,
+            args.language_code,
+            args.max_seconds_example,
+        )
+        batch_sampler = get_word_segments.DurationBatchSampler(
+            [sgm["duration"] for sgm in dataset.segments], args.max_seconds_batch
+        )
+        for indices in batch_sampler:
+            audios, _, tokenized_cleaned_txts, *_, token_ids = dataset.my_collate_fn(
+                [dataset[indices]]
+            )
+            with torch.no_grad():
+                emissions, true_lens = get_word_segments.get_emissions(
+                    audios, model, processor, device
+                )
+            for emission, true_len, txt, tokens in zip(
+                emissions, true_lens, tokenized_cleaned_txts, token_ids
+            ):
+                if txt:
+                    examples.append((emission[:true_len], tokens, txt))
+    return examples
+
+
+def load_audio_batches(args, vocab) -> list[list[np.ndarray]]:
+    """loads the audio of the batches of the original segments of the first talks"""
+    segments_per_talk = get_word_segments.load_data(args.path_to_yaml, args.path_to_txt)
+    batches = []
+    for talk_id in list(segments_per_talk.keys())[: args.num_talks]:
+        dataset = get_word_segments.WavDataset(
+            Path(args.path_to_wav) / f"{talk_id}.wav",
+            segments_per_talk[talk_id],
+            vocab,
+            args.language_code,
+            args.max_seconds_example,
+        )
+        batch_sampler = get_word_segments.DurationBatchSampler(
+            [sgm["duration"] for sgm in dataset.segments], args.max_seconds_batch
+        )
+        for indices in batch_sampler:
+            batches.append(dataset.my_collate_fn([dataset[indices]])[0])
+    return batches
+
+
+def time_paths(examples, batch_size, **kwargs) -> tuple[list, float]:
+    """aligns the examples in batches and measures the time it took"""
+    paths = []
+    start = time.perf_counter()
+    for i in range(0, len(examples), batch_size):
+        batch = examples[i : i + batch_size]
+        paths.extend(
+            get_word_segments.get_paths(
+                [example[0] for example in batch],
+                [example[1] for example in batch],
+                **kwargs,
+            )
+        )
+    return paths, time.perf_counter() - start
+
+
+def word_boundaries(path, txt) -> np.ndarray:
+    """start and end (in seconds) of the words of a path"""
+    words = forced_alignment.merge_words(forced_alignment.merge_repeats(path, txt), 0)
+    return np.concatenate([words.start, words.end])
+
+
+def bench_blank_compression(args):
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    model, tokenizer, processor = get_word_segments.load_model(
+        args.language_code, device
+    )
+    examples = load_examples(args, model, processor, tokenizer.encoder, device)
+    num_frames = sum(example[0].size(0) for example in examples)
+    print(f"{len(examples)} examples, {num_frames} frames")
+    if not num_frames:
+        return
+
+    reference, reference_time = time_paths(examples, args.batch_size)
+    print(f"{'exact':>10}: {num_frames / reference_time:10.0f} frames/s")
+
+    for threshold in args.thresholds:
+        num_compressed = sum(
+            forced_alignment.compress_blank_frames(example[0], threshold)[0].size(0)
+            for example in examples
+        )
+        paths, elapsed = time_paths(
+            examples, args.batch_size, blank_threshold=threshold
+        )
+
+        identical, shifts, failed = 0, [], 0
+        for path, ref_path, example in zip(paths, reference, examples):
+            if not path or not ref_path:
+                failed += bool(path) != bool(ref_path)
+                continue
+            identical += np.array_equal(path.time_index, ref_path.time_index)
+            shifts.append(
+                np.abs(
+                    word_boundaries(path, example[2])
+                    - word_boundaries(ref_path, example[2])
+                )
+            )
+        # (none to compare if no example has a path, e.g. all texts are empty)
+        comparison = f"identical paths: {identical}/{len(shifts)}, "
+        shifts = np.concatenate(shifts) if shifts else np.zeros(0)
+        if shifts.size:
+            comparison += (
+                f"word boundary shift: mean {shifts.mean():.4f}s "
+                f"max {shifts.max():.2f}s, "
+            )
+        print(
+            f"{threshold:>10}: {num_frames / elapsed:10.0f} frames/s "
+            f"(x{reference_time / elapsed:.2f}), "
+            f"frames kept: {num_compressed / num_frames:.1%}, "
+            f"{comparison}different outcome: {failed}"
+        )
+
+
+def bench_audio_loading(args):
+    with open(args.path_to_yaml) as f:
+        segments = yaml.load(f, Loader=yaml.CLoader)
+    segments_per_talk = {}
+    for segment in segments:
+        segments_per_talk.setdefault(segment["wav"].split(".")[0], []).append(segment)
+    talk_ids = list(segments_per_talk.keys())[: args.num_talks]
+    num_segments = sum(len(segments_per_talk[talk_id]) for talk_id in talk_ids)
+    print(f"{len(talk_ids)} talks, {num_segments} segments")
+
+    def load_sox(path_to_wav, talk_segments):
+        return [
+            torchaudio.backend.sox_io_backend.load(
+                path_to_wav, int(sgm["offset"] * SR), int(sgm["duration"] * SR)
+            )[0].numpy()[0]
+            for sgm in talk_segments
+        ]
+
+    def load_talk_audio(path_to_wav, talk_segments):
+        audio = TalkAudio(path_to_wav)
+        return [
+            to_float32(audio.segment(sgm["offset"], sgm["duration"]))
+            for sgm in talk_segments
+        ]
+
+    audios = {}
+    for name, load_fn in [("sox", load_sox), ("talk audio", load_talk_audio)]:
+        start = time.perf_counter()
+        audios[name] = [
+            audio
+            for talk_id in talk_ids
+            for audio in load_fn(
+                Path(args.path_to_wav) / f"{talk_id}.wav", segments_per_talk[talk_id]
+            )
+        ]
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {num_segments / elapsed:10.0f} segments/s")
+
+    identical = all(
+        np.array_equal(a1, a2) for a1, a2 in zip(audios["sox"], audios["talk audio"])
+    )
+    print(f"identical samples: {identical}")
+
+
+def bench_batching(args):
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    model, tokenizer, processor = get_word_segments.load_model(
+        args.language_code, device
+    )
+    segments_per_talk = get_word_segments.load_data(args.path_to_yaml, args.path_to_txt)
+    talks = [
+        get_word_segments.WavDataset(
+            Path(args.path_to_wav) / f"{talk_id}.wav",
+            segments_per_talk[talk_id],
+            tokenizer.encoder,
+            args.language_code,
+            args.max_seconds_example,
+        )
+        for talk_id in list(segments_per_talk.keys())[: args.num_talks]
+    ]
+    num_segments = sum(len(talk) for talk in talks)
+    total_seconds = sum(sgm["duration"] for talk in talks for sgm in talk.segments)
+    print(f"{len(talks)} talks, {num_segments} segments, {total_seconds:.0f}s of audio")
+
+    for batching in ["talk", "global"]:
+        dataset = get_word_segments.TalksDataset(
+            talks, args.max_seconds_batch, batching
+        )
+        # the batches are loaded beforehand, to time only the inference and alignment
+        batches = [dataset[i][1] for i in range(len(dataset))]
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            for batch in batches:
+                get_word_segments.align_batch(
+                    batch,
+                    model,
+                    processor,
+                    tokenizer.encoder,
+                    args.language_code,
+                    device,
+                )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{batching:>10}: {len(dataset):6d} batches, "
+            f"padding ratio {dataset.padding_ratio():6.1%}, "
+            f"{num_segments / elapsed:8.1f} segments/s, "
+            f"{total_seconds / elapsed:8.1f} audio seconds/s"
+        )
+
+
+def bench_num_procs(args):
+    model, tokenizer, processor = get_word_segments.load_model(
+        args.language_code, torch.device("cpu")
+    )
+    segments_per_talk = get_word_segments.load_data(args.path_to_yaml, args.path_to_txt)
+    talk_ids = list(segments_per_talk.keys())[: args.num_talks]
+
+    results = []
+    for num_procs in args.num_procs:
+        with tempfile.TemporaryDirectory() as out_dir:
+            # the defaults of get_word_segments.py for the rest of the options
+            run_args = get_word_segments.get_parser().parse_args(
+                [
+                    "-lang",
+                    args.language_code,
+                    "-wav",
+                    args.path_to_wav,
+                    "-txt",
+                    args.path_to_txt,
+                    "-yaml",
+                    args.path_to_yaml,
+                    "-out",
+                    out_dir,
+                    "-max1",
+                    str(args.max_seconds_example),
+                    "-max2",
+                    str(args.max_seconds_batch),
+                    "--num-procs",
+                    str(num_procs),
+                ]
+            )
+            results.append(
+                get_word_segments.get_word_segments_multiprocess(
+                    run_args,
+                    talk_ids,
+                    segments_per_talk,
+                    model,
+                    tokenizer,
+                    processor,
+                    None,
+                )
+            )
+
+    print(f"{'procs':>6} {'audio s/s':>10} {'worker RSS':>11} {'total PSS':>10}")
+    for num_procs, stats in zip(args.num_procs, results):
+        print(
+            f"{num_procs:>6} {stats['audio_seconds_per_second']:>10.1f} "
+            f"{stats['worker_peak_rss_mb']:>8.0f} MB {stats['total_pss_mb']:>7.0f} MB"
+        )
+
+
+def bench_onnx(args):
+    device = torch.device("cpu")
+    model, tokenizer, _ = get_word_segments.load_model(args.language_code, device)
+    onnx_model, _, _ = get_word_segments.load_model(
+        args.language_code,
+        device,
+        backend="onnx",
+        onnx_dir=args.onnx_dir,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+    )
+
+    # the same padded batches for both backends
+    audio_batches = load_audio_batches(args, tokenizer.encoder)
+    batch_builder = BatchBuilder()
+    batches = []
+    for audios in audio_batches:
+        input_values, attention_mask = batch_builder(audios)
+        batches.append((input_values.clone(), attention_mask))
+    total_seconds = sum(len(audio) for audios in audio_batches for audio in audios) / SR
+    print(f"{len(batches)} batches, {total_seconds:.0f}s of audio")
+
+    max_diff = max(logits_parity(model, onnx_model, *batch) for batch in batches)
+    print(f"logits parity: max abs diff {max_diff:.2e}")
+
+    for name, backend_model in [("torch", model), ("onnx", onnx_model)]:
+        # warm-up (and creation of the onnx session)
+        with torch.no_grad():
+            backend_model(*batches[0])
+        start = time.perf_counter()
+        with torch.no_grad():
+            for input_values, attention_mask in batches:
+                backend_model(input_values, attention_mask=attention_mask)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>6}: {total_seconds / elapsed:8.1f} audio seconds/s")
+
+
+def bench_batch_building(args):
+    _, tokenizer, processor = get_word_segments.load_model(
+        args.language_code, torch.device("cpu"), lazy=True
+    )
+    batches = load_audio_batches(args, tokenizer.encoder)
+    num_examples = sum(len(audios) for audios in batches)
+    print(f"{len(batches)} batches, {num_examples} segments")
+
+    def build_with_processor(audios):
+        tokenized_audio = processor(
+            [to_float32(audio) for audio in audios],
+            return_tensors="pt",
+            padding="longest",
+            sampling_rate=SR,
+        )
+        return tokenized_audio.input_values, tokenized_audio.attention_mask
+
+    batch_builder = BatchBuilder()
+    for name, build_fn in [
+        ("processor", build_with_processor),
+        ("builder", batch_builder),
+    ]:
+        start = time.perf_counter()
+        for audios in batches:
+            build_fn(audios)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {len(batches) / elapsed:8.1f} batches/s")
+
+    # the output of the builder is only valid until its next call
+    identical = True
+    for audios in batches:
+        reference = build_with_processor(audios)
+        identical &= all(
+            torch.equal(x, y) and x.dtype == y.dtype
+            for x, y in zip(batch_builder(audios), reference)
+        )
+    print(f"identical input values and attention masks: {identical}")
+
+
+def get_monolingual_alignments_reference(
+    original_tokens: list[str], clean_tokens: list[str], lang: str
+) -> dict[int, str]:
+    """the previous "forced_alignment.get_monolingual_alignments", which normalized
+    the original tokens in every comparison"""
+
+    def get_original(idx=None, token=None):
+        if token is None:
+            token = original_tokens[idx]
+        token = text_cleaning.handle_html_non_utf(token, lang)
+        token = text_cleaning.my_num2words(token, lang)
+        return token.lower()
+
+    def get_clean(idx):
+        return clean_tokens[idx].lower()
+
+    def add_alignment(alignment, i, token_j):
+        if i in alignment.keys():
+            alignment[i].append(token_j)
+        else:
+            alignment[i] = [token_j]
+        return alignment
+
+    if clean_tokens == [""]:
+        alignment = {0: " ".join(original_tokens)}
+        return alignment
+
+    alignment = {}
+    j1, j2, i = 0, 0, 0
+    while i < len(clean_tokens):
+        queue = []
+        original_tokens_iter = list(range(len(original_tokens)))[j1:]
+        for j1 in original_tokens_iter:
+            if i < len(clean_tokens) and get_clean(i) in get_original(j1):
+                queue.append(j1)
+                for j2 in queue:
+                    alignment = add_alignment(alignment, i, original_tokens[j2])
+                queue = []
+                i += 1
+                while i < len(clean_tokens) and get_clean(i) in get_original(j1):
+                    alignment = add_alignment(alignment, i, original_tokens[j1])
+                    i += 1
+            else:
+                queue.append(j1)
+    for j2 in queue:
+        alignment = add_alignment(alignment, i - 1, original_tokens[j2])
+
+    for i in list(alignment.keys())[:-1]:
+        clean_token = clean_tokens[i]
+        if len(clean_token) < 3:
+            if len(alignment[i + 1]) > 1:
+                score = fuzz.ratio(
+                    get_original(token=alignment[i][-1]), clean_token.lower()
+                )
+                score_next = fuzz.ratio(
+                    get_original(token=alignment[i + 1][0]), clean_token.lower()
+                )
+                if score_next > score:
+                    alignment[i][-1] = alignment[i + 1][0]
+                    del alignment[i + 1][0]
+
+    for k, v in alignment.items():
+        alignment[k] = " ".join(v)
+
+    return alignment
+
+
+def load_text_examples(args) -> tuple[list[tuple], list[tuple]]:
+    """(original tokens, clean tokens) of each segment with some text,
+    and of each talk as a single long transcript"""
+    _, tokenizer, _ = get_word_segments.load_model(
+        args.language_code, torch.device("cpu"), lazy=True
+    )
+    segments_per_talk = get_word_segments.load_data(args.path_to_yaml, args.path_to_txt)
+
+    segments, talks = [], []
+    for talk_id in list(segments_per_talk.keys())[: args.num_talks]:
+        dataset = get_word_segments.WavDataset(
+            Path(args.path_to_wav) / f"{talk_id}.wav",
+            segments_per_talk[talk_id],
+            tokenizer.encoder,
+            args.language_code,
+            args.max_seconds_example,
+            load_audio=False,
+        )
+        talk_segments = [
+            (sgm["text"].split(), txt.split("|"))
+            for sgm, txt in zip(dataset.segments, dataset.tokenized_cleaned_txts)
+            if txt
+        ]
+        segments.extend(talk_segments)
+        talks.append(
+            (
+                [token for original, _ in talk_segments for token in original],
+                [token for _, clean in talk_segments for token in clean],
+            )
+        )
+    return segments, talks
+
+
+def bench_monolingual_alignments(args):
+    segments, talks = load_text_examples(args)
+    num_tokens = sum(len(original) for original, _ in segments)
+    print(f"{len(segments)} segments, {len(talks)} talks, {num_tokens} tokens")
+
+    for examples_name, examples in [("segments", segments), ("talks", talks)]:
+        outputs = {}
+        for name, align_fn in [
+            ("reference", get_monolingual_alignments_reference),
+            ("table", forced_alignment.get_monolingual_alignments),
+        ]:
+            start = time.perf_counter()
+            outputs[name] = [
+                align_fn(original, clean, args.language_code)
+                for original, clean in examples
+            ]
+            elapsed = time.perf_counter() - start
+            print(
+                f"{examples_name:>8} {name:>9}: {num_tokens / elapsed:10.1f} tokens/s"
+            )
+        identical = outputs["reference"] == outputs["table"]
+        print(f"{examples_name:>8} identical mappings: {identical}")
+
+
+def bench_text_aligners(args):
+    segments, talks = load_text_examples(args)
+    num_tokens = sum(len(original) for original, _ in segments)
+    print(f"{len(segments)} segments, {len(talks)} talks, {num_tokens} tokens")
+
+    for examples_name, examples in [("segments", segments), ("talks", talks)]:
+        outputs = {}
+        for name, align_fn in forced_alignment.TEXT_ALIGNERS.items():
+            start = time.perf_counter()
+            outputs[name] = [
+                align_fn(original, clean, args.language_code)
+                for original, clean in examples
+            ]
+            elapsed = time.perf_counter() - start
+            print(
+                f"{examples_name:>8} {name:>6}: {num_tokens / elapsed:10.1f} tokens/s"
+            )
+
+        # agreement of each aligner with the greedy one, by example and by clean token
+        for name, mappings in outputs.items():
+            if name == "greedy":
+                continue
+            same_examples, same_tokens, num_clean = 0, 0, 0
+            for greedy_mapping, mapping in zip(outputs["greedy"], mappings):
+                same_examples += greedy_mapping == mapping
+                same_tokens += sum(
+                    greedy_mapping.get(i) == original for i, original in mapping.items()
+                )
+                num_clean += len(mapping)
+            print(
+                f"{examples_name:>8} {name:>6}: "
+                f"{same_examples / len(examples):.2%} identical examples, "
+                f"{same_tokens / num_clean:.2%} identical clean tokens"
+            )
+
+
+def add_data_arguments(parser: argparse.ArgumentParser):
+    """arguments for benchmarks on real data (as in get_word_segments.py)"""
+    parser.add_argument("--language-code", "-lang", type=str, required=True)
+    parser.add_argument("--path-to-wav", "-wav", type=str, required=True)
+    parser.add_argument("--path-to-txt", "-txt", type=str, required=True)
+    parser.add_argument("--path-to-yaml", "-yaml", type=str, required=True)
+    parser.add_argument("--num-talks", "-n", type=int, default=5)
+    parser.add_argument("--max-seconds-example", "-max1", type=float, default=60)
+    parser.add_argument("--max-seconds-batch", "-max2", type=float, default=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    trellis_parser = subparsers.add_parser(
+        "trellis", help="frames/second of the trellis backends"
+    )
+    trellis_parser.add_argument("--batch-size", "-bs", type=int, default=16)
+    trellis_parser.add_argument("--num-frames", "-frames", type=int, default=1000)
+    trellis_parser.add_argument("--vocab-size", "-vocab", type=int, default=32)
+    trellis_parser.add_argument("--repeats", "-r", type=int, default=3)
+    trellis_parser.set_defaults(func=bench_trellis)
+
+    blank_parser = subparsers.add_parser(
+        "blank-compression",
+        help="speedup and accuracy of collapsing blank frames, on real talks",
+    )
+    add_data_arguments(blank_parser)
+    blank_parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.999, 0.99, 0.9]
+    )
+    blank_parser.add_argument("--batch-size", "-bs", type=int, default=16)
+    blank_parser.set_defaults(func=bench_blank_compression)
+
+    batching_parser = subparsers.add_parser(
+        "batching", help="throughput of the per-talk and global batching, on real talks"
+    )
+    add_data_arguments(batching_parser)
+    batching_parser.set_defaults(func=bench_batching)
+
+    procs_parser = subparsers.add_parser(
+        "num-procs",
+        help="throughput and memory of the --num-procs mode, on real talks (cpu)",
+    )
+    add_data_arguments(procs_parser)
+    procs_parser.add_argument("--num-procs", type=int, nargs="+", default=[1, 2, 4, 8])
+    procs_parser.set_defaults(func=bench_num_procs)
+
+    onnx_parser = subparsers.add_parser(
+        "onnx",
+        help="logits parity and throughput of the onnx backend against torch (cpu)",
+    )
+    add_data_arguments(onnx_parser)
+    onnx_parser.add_argument("--onnx-dir", type=str, default=str(DEFAULT_ONNX_DIR))
+    onnx_parser.add_argument("--intra-op-threads", type=int, default=None)
+    onnx_parser.add_argument("--inter-op-threads", type=int, default=None)
+    onnx_parser.set_defaults(func=bench_onnx)
+
+    building_parser = subparsers.add_parser(
+        "batch-building",
+        help="batches/second of building the input of the model, on real talks",
+    )
+    add_data_arguments(building_parser)
+    building_parser.set_defaults(func=bench_batch_building)
+
+    monolingual_parser = subparsers.add_parser(
+        "monolingual-alignments",
+        help="tokens/second of mapping the clean to the original tokens, on real talks",
+    )
+    add_data_arguments(monolingual_parser)
+    monolingual_parser.set_defaults(func=bench_monolingual_alignments)
+
+    aligners_parser = subparsers.add_parser(
+        "text-aligners",
+        help="tokens/second and agreement of the aligners of the clean to the "
+        "original tokens, on real talks",
+    )
+    add_data_arguments(aligners_parser)
+    aligners_parser.set_defaults(func=bench_text_aligners)
+
+    audio_parser = subparsers.add_parser(
+        "audio-loading",
+        help="segments/second of loading the audio of the segments of the talks",
+    )
+    audio_parser.add_argument("--path-to-wav", "-wav", type=str, required=True)
+    audio_parser.add_argument("--path-to-yaml", "-yaml", type=str, required=True)
+    audio_parser.add_argument("--num-talks", "-n", type=int, default=20)
+    audio_parser.set_defaults(func=bench_audio_loading)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,164 @@
+import argparse
+import json
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import numpy as np
+import yaml
+from get_source_text import (
+    WordSegmentIndex,
+    get_text_for_segment,
+    post_process_text,
+    remove_failed,
+)
+
+
+def load_segments_per_talk(path_to_yaml: Path) -> dict:
+    """loads a segmentation and groups its segments by talk"""
+    with open(path_to_yaml) as f:
+        segments = yaml.load(f, Loader=yaml.CLoader)
+
+    segments_per_talk = {}
+    for segment in segments:
+        talk_id = segment["wav"].split(".")[0]
+        segments_per_talk.setdefault(talk_id, []).append(segment)
+    return segments_per_talk
+
+
+def boundary_shifts(
+    reference_words: list[dict], candidate_words: list[dict]
+) -> tuple[np.ndarray, int]:
+    """finds the shifts of the start and end of the words that are in both outputs
+    (words that are only in one of them, e.g. due to failed segments, are skipped)
+
+    Args:
+        reference_words (list[dict]): word segments of the reference
+        candidate_words (list[dict]): word segments of the candidate
+
+    Returns:
+        tuple[np.ndarray, int]: absolute shifts in seconds and number of matched words
+    """
+    matcher = SequenceMatcher(
+        None,
+        [(w["word"], w["text"]) for w in reference_words],
+        [(w["word"], w["text"]) for w in candidate_words],
+        autojunk=False,
+    )
+    shifts = []
+    num_matched = 0
+    for i, j, size in matcher.get_matching_blocks():
+        for k in range(size):
+            ref, cand = reference_words[i + k], candidate_words[j + k]
+            shifts.extend(
+                [abs(ref["start"] - cand["start"]), abs(ref["end"] - cand["end"])]
+            )
+        num_matched += size
+    return np.array(shifts), num_matched
+
+
+def source_texts(segments: list[dict], alignment: dict) -> dict:
+    """the post-processed source text of each new segment (as in get_source_text.py)
+
+    Args:
+        segments (list[dict]): new segments of a talk
+        alignment (dict): output of get_word_segments.py for the talk
+
+    Returns:
+        dict: text of each (offset, duration) of the segments that are kept
+    """
+    word_index = WordSegmentIndex(alignment["word_segments"])
+    texts = {}
+    for segment in remove_failed(segments, alignment["failed_segments"]):
+        _, original_txt = get_text_for_segment(segment, word_index)
+        txt = post_process_text(original_txt)
+        if txt:
+            texts[(segment["offset"], segment["duration"])] = txt
+    return texts
+
+
+def compare_alignments(args):
+    reference_dir = Path(args.path_to_reference_dir)
+    candidate_dir = Path(args.path_to_candidate_dir)
+    original_segments = load_segments_per_talk(args.path_to_yaml)
+    new_segments = (
+        load_segments_per_talk(args.path_to_new_yaml) if args.path_to_new_yaml else {}
+    )
+
+    shifts, num_matched, num_reference_words = [], 0, 0
+    num_segments, num_failed = 0, {"reference": 0, "candidate": 0}
+    num_texts, num_different, num_only = 0, 0, {"reference": 0, "candidate": 0}
+    num_talks = 0
+    for reference_file in sorted(reference_dir.glob("*.json")):
+        candidate_file = candidate_dir / reference_file.name
+        if not candidate_file.exists():
+            print(f"{candidate_file} not found. Skipping.")
+            continue
+        num_talks += 1
+
+        talk_id = reference_file.stem
+        with open(reference_file) as f:
+            reference = json.load(f)
+        with open(candidate_file) as f:
+            candidate = json.load(f)
+
+        talk_shifts, talk_matched = boundary_shifts(
+            reference["word_segments"], candidate["word_segments"]
+        )
+        shifts.append(talk_shifts)
+        num_matched += talk_matched
+        num_reference_words += len(reference["word_segments"])
+
+        num_segments += len(original_segments.get(talk_id, []))
+        num_failed["reference"] += len(reference["failed_segments"])
+        num_failed["candidate"] += len(candidate["failed_segments"])
+
+        if talk_id in new_segments:
+            reference_texts = source_texts(new_segments[talk_id], reference)
+            candidate_texts = source_texts(new_segments[talk_id], candidate)
+            for key in reference_texts.keys() | candidate_texts.keys():
+                num_texts += 1
+                if key not in candidate_texts:
+                    num_only["reference"] += 1
+                elif key not in reference_texts:
+                    num_only["candidate"] += 1
+                elif reference_texts[key] != candidate_texts[key]:
+                    num_different += 1
+
+    shifts = np.concatenate(shifts) if shifts else np.zeros(0)
+    print(f"{num_talks} talks")
+    print(
+        f"matched words: {num_matched} "
+        f"({num_matched / max(1, num_reference_words):.1%} of the reference)"
+    )
+    if len(shifts):
+        print(
+            f"boundary shift: mean {shifts.mean():.4f}s, max {shifts.max():.2f}s, "
+            f"> {args.tolerance}s: {(shifts > args.tolerance).mean():.2%}"
+        )
+    for name, failed in num_failed.items():
+        print(
+            f"failed segments ({name}): {failed} "
+            f"({failed / max(1, num_segments):.2%} of {num_segments})"
+        )
+    if args.path_to_new_yaml:
+        print(
+            f"source text of the new segments: {num_different} of {num_texts} "
+            f"different ({num_different / max(1, num_texts):.2%}), "
+            f"{num_only['reference']} only in the reference, "
+            f"{num_only['candidate']} only in the candidate"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compares the outputs of get_word_segments.py "
+        "(e.g. with a reduced --precision) against a reference (fp32) run"
+    )
+    parser.add_argument("--path-to-reference-dir", "-ref", type=str, required=True)
+    parser.add_argument("--path-to-candidate-dir", "-cand", type=str, required=True)
+    parser.add_argument("--path-to-yaml", "-yaml", type=str, required=True)
+    parser.add_argument("--path-to-new-yaml", "-new_yaml", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    args = parser.parse_args()
+
+    compare_alignments(args)
@@ -0,0 +1,162 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+_FILE_DIGESTS = {}
+# dtype of the stored emissions (the emissions of a run with the cache are
+# rounded to it, also the ones that are computed in the run)
+EMISSION_DTYPE = np.float16
+# fraction of the maximum size that is left after an eviction, so that the
+# directory is not scanned again for every new entry (it is scanned again
+# after a process writes the rest of the maximum size)
+EVICTION_LOW_WATER = 0.9
+
+
+def file_digest(path: Path, chunk_size: int = 2**20) -> str:
+    """sha1 of the contents of a file (memoized by path, size and modification time)"""
+    stat = os.stat(path)
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_DIGESTS:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha1.update(chunk)
+        _FILE_DIGESTS[memo_key] = sha1.hexdigest()
+    return _FILE_DIGESTS[memo_key]
+
+
+class EmissionCache:
+    def __init__(self, cache_dir: Path, model_name: str, max_size_gb: float):
+        """on-disk cache of the log-probabilities of wav2vec2.0 for audio segments,
+        stored as float16 arrays that are memory-mapped when read.
+        When the cache grows beyond max_size_gb, the least recently used
+        entries are evicted (down to EVICTION_LOW_WATER of it).
+
+        Each process (e.g. the workers of --num-procs) keeps its own running
+        total of the size of the cache, which only counts its own entries since
+        the last scan of the directory. The directory is scanned again before
+        evicting and after writing (1 - EVICTION_LOW_WATER) * max_size_gb, so a
+        cache shared by n processes stays below about
+        (1 + n * (1 - EVICTION_LOW_WATER)) * max_size_gb.
+
+        Args:
+            cache_dir (Path): directory of the cache (can be shared by several runs)
+            model_name (str): name of the model that produced the emissions
+            max_size_gb (float): maximum size of the cache in GB
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_size = int(max_size_gb * 1024**3)
+
+        self._scan()
+
+    def _scan(self) -> dict[str, float]:
+        """reads the size of the entries from the cache directory (which can
+        have been changed by other processes)
+
+        Returns:
+            dict[str, float]: the time of the last use of each entry
+        """
+        self.sizes, last_used = {}, {}
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            self.sizes[path.name] = stat.st_size
+            last_used[path.name] = stat.st_mtime
+        self.total_size = sum(self.sizes.values())
+        self.unscanned_size = 0
+        return last_used
+
+    def _path(
+        self,
+        audio_digest: str,
+        offset: float,
+        duration: float,
+        chunk_seconds: float = None,
+    ) -> Path:
+        key = f"{self.model_name}|{audio_digest}|{offset!r}|{duration!r}"
+        if chunk_seconds is not None:
+            key += f"|{chunk_seconds!r}"
+        return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.npy"
+
+    def get(
+        self,
+        audio_digest: str,
+        offset: float,
+        duration: float,
+        chunk_seconds: float = None,
+    ) -> np.ndarray:
+        """returns the memory-mapped emission of a segment, or None if not cached
+
+        Args:
+            audio_digest (str): digest of the wav file (from "file_digest")
+            offset (float): start of the segment in the wav file
+            duration (float): duration of the segment (None for the whole file)
+            chunk_seconds (float, optional): for segments whose emission was
+                computed in chunks (or windows), the length of the chunks
+        """
+        path = self._path(audio_digest, offset, duration, chunk_seconds)
+        try:
+            emission = np.load(path, mmap_mode="r")
+            # the modification time marks the last use
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return emission
+
+    def put(
+        self,
+        audio_digest: str,
+        offset: float,
+        duration: float,
+        emission: torch.Tensor,
+        chunk_seconds: float = None,
+    ) -> torch.Tensor:
+        """stores the emission of a segment (arguments as in "get")
+
+        Returns:
+            torch.Tensor: the emission as it will be read from the cache,
+            so that cached and non-cached runs give the same results
+        """
+        path = self._path(audio_digest, offset, duration, chunk_seconds)
+        emission = emission.numpy().astype(EMISSION_DTYPE)
+
+        # write and rename, for other processes that might be reading the cache
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, emission)
+        os.replace(tmp_path, path)
+
+        size = path.stat().st_size
+        self.total_size += size - self.sizes.get(path.name, 0)
+        self.unscanned_size += size
+        self.sizes[path.name] = size
+        if (
+            self.total_size > self.max_size
+            or self.unscanned_size > (1 - EVICTION_LOW_WATER) * self.max_size
+        ):
+            self._evict()
+
+        return torch.from_numpy(emission.astype(np.float32))
+
+    def _evict(self):
+        """if the cache is larger than max_size, removes the least recently used
+        entries until it fits in EVICTION_LOW_WATER of it"""
+        last_used = self._scan()
+        if self.total_size <= self.max_size:
+            return
+        for name in sorted(self.sizes, key=last_used.get):
+            if self.total_size <= EVICTION_LOW_WATER * self.max_size:
+                break
+            self.total_size -= self.sizes.pop(name)
+            try:
+                os.remove(self.cache_dir / name)
+            except FileNotFoundError:
+                pass
@@ -1,10 +1,17 @@
 from dataclasses import dataclass
 
+import Levenshtein
+import numpy as np
 import torch
 from fuzzywuzzy import fuzz
 
 import text_cleaning
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 
 @dataclass
 class Segment:
@@ -22,11 +29,150 @@ class Segment:
         return self.end - self.start
 
 
+def _pack_labels(labels: list[str]) -> tuple[str, np.ndarray]:
+    """packs a list of labels into a single string and the offsets of each label"""
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum([len(label) for label in labels], out=offsets[1:])
+    return "".join(labels), offsets
+
+
 @dataclass
-class Point:
-    token_index: int
-    time_index: int
-    score: float
+class SegmentArray:
+    """a list of segments in columnar form, with the labels and original labels
+    of all the segments packed into a single string and indexed by offsets"""
+
+    start: np.ndarray
+    end: np.ndarray
+    score: np.ndarray
+    label_buffer: str
+    label_offsets: np.ndarray
+    original_label_buffer: str
+    original_label_offsets: np.ndarray
+
+    @classmethod
+    def from_lists(
+        cls,
+        start,
+        end,
+        score,
+        labels: list[str],
+        original_labels: list[str] = None,
+    ):
+        if original_labels is None:
+            original_labels = [""] * len(labels)
+        return cls(
+            np.asarray(start),
+            np.asarray(end),
+            np.asarray(score, dtype=np.float64),
+            *_pack_labels(labels),
+            *_pack_labels(original_labels),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls.from_lists(
+            np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), [], []
+        )
+
+    @classmethod
+    def concatenate(cls, segment_arrays: list):
+        """concatenates several SegmentArrays into a new one"""
+        if not segment_arrays:
+            return cls.empty()
+        return cls.from_lists(
+            np.concatenate([sgms.start for sgms in segment_arrays]),
+            np.concatenate([sgms.end for sgms in segment_arrays]),
+            np.concatenate([sgms.score for sgms in segment_arrays]),
+            [label for sgms in segment_arrays for label in sgms.labels],
+            [label for sgms in segment_arrays for label in sgms.original_labels],
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, idx: int) -> Segment:
+        return Segment(
+            self.label_buffer[self.label_offsets[idx] : self.label_offsets[idx + 1]],
+            self.start[idx].item(),
+            self.end[idx].item(),
+            self.score[idx].item(),
+            self.original_label_buffer[
+                self.original_label_offsets[idx] : self.original_label_offsets[idx + 1]
+            ],
+        )
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+    @property
+    def labels(self) -> list[str]:
+        offsets = self.label_offsets.tolist()
+        return [self.label_buffer[i:j] for i, j in zip(offsets[:-1], offsets[1:])]
+
+    @property
+    def original_labels(self) -> list[str]:
+        offsets = self.original_label_offsets.tolist()
+        return [
+            self.original_label_buffer[i:j] for i, j in zip(offsets[:-1], offsets[1:])
+        ]
+
+    def label_mask(self, label: str) -> np.ndarray:
+        """boolean mask of the segments whose label is equal to "label" """
+        if len(label) != 1:
+            return np.array([lbl == label for lbl in self.labels], dtype=bool)
+        # compare the code points of the single-character labels at once
+        code_points = np.frombuffer(
+            self.label_buffer.encode("utf-32-le"), dtype=np.uint32
+        )
+        mask = np.diff(self.label_offsets) == 1
+        mask[mask] = code_points[self.label_offsets[:-1][mask]] == ord(label)
+        return mask
+
+    def take(self, indices: np.ndarray):
+        """returns a new SegmentArray with the segments at the given indices"""
+        labels, original_labels = self.labels, self.original_labels
+        return SegmentArray.from_lists(
+            self.start[indices],
+            self.end[indices],
+            self.score[indices],
+            [labels[i] for i in indices],
+            [original_labels[i] for i in indices],
+        )
+
+    def with_original_labels(self, original_labels: dict[int, str]):
+        """returns a new SegmentArray with the original labels of some segments replaced"""
+        new_original_labels = self.original_labels
+        for i, original_label in original_labels.items():
+            new_original_labels[i] = original_label
+        return SegmentArray(
+            self.start,
+            self.end,
+            self.score,
+            self.label_buffer,
+            self.label_offsets,
+            *_pack_labels(new_original_labels),
+        )
+
+
+@dataclass
+class PointArray:
+    """the path of a forced-alignment, one entry per frame"""
+
+    token_index: np.ndarray
+    time_index: np.ndarray
+    score: np.ndarray
+
+    def __len__(self):
+        return len(self.token_index)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float32),
+        )
 
 
 def get_trellis(emission, tokens, blank_id=0):
@@ -49,8 +195,164 @@ def get_trellis(emission, tokens, blank_id=0):
     return trellis
 
 
-def backtrack(trellis, emission, tokens, blank_id=0):
-    """taken from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html"""
+def _fill_trellis_torch(
+    trellis: torch.Tensor,
+    emissions: torch.Tensor,
+    tokens: torch.Tensor,
+    num_frames: list[int],
+    num_tokens: list[int],
+    blank_id: int,
+    backpointers: torch.Tensor = None,
+):
+    """fills the batched trellis with one step per frame for all the segments"""
+    blank_emissions = emissions[:, :, blank_id].unsqueeze(-1)
+    token_emissions = torch.gather(
+        emissions, 2, tokens.unsqueeze(1).expand(-1, emissions.size(1), -1)
+    )
+    # frames and tokens beyond the length of a segment do not affect its valid part
+    for t in range(max(num_frames)):
+        stayed = trellis[:, t, 1:] + blank_emissions[:, t]
+        changed = trellis[:, t, :-1] + token_emissions[:, t]
+        trellis[:, t + 1, 1:] = torch.maximum(stayed, changed)
+        if backpointers is not None:
+            backpointers[:, t + 1, 1:] = changed > stayed
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _fill_trellis_numba_kernel(
+        trellis,
+        emissions,
+        tokens,
+        num_frames,
+        num_tokens,
+        blank_id,
+        backpointers,
+        record_backpointers,
+    ):
+        for b in numba.prange(trellis.shape[0]):
+            for t in range(num_frames[b]):
+                blank_emission = emissions[b, t, blank_id]
+                for j in range(1, num_tokens[b] + 1):
+                    stayed = trellis[b, t, j] + blank_emission
+                    changed = trellis[b, t, j - 1] + emissions[b, t, tokens[b, j - 1]]
+                    trellis[b, t + 1, j] = max(stayed, changed)
+                    if record_backpointers:
+                        backpointers[b, t + 1, j] = changed > stayed
+
+
+def _fill_trellis_numba(
+    trellis: torch.Tensor,
+    emissions: torch.Tensor,
+    tokens: torch.Tensor,
+    num_frames: list[int],
+    num_tokens: list[int],
+    blank_id: int,
+    backpointers: torch.Tensor = None,
+):
+    """fills the batched trellis with a compiled loop (modifies it in-place)"""
+    _fill_trellis_numba_kernel(
+        trellis.numpy(),
+        emissions.contiguous().numpy(),
+        tokens.numpy(),
+        np.array(num_frames, dtype=np.int64),
+        np.array(num_tokens, dtype=np.int64),
+        blank_id,
+        (
+            np.empty((0, 0, 0), dtype=np.uint8)
+            if backpointers is None
+            else backpointers.numpy()
+        ),
+        backpointers is not None,
+    )
+
+
+TRELLIS_BACKENDS = {"torch": _fill_trellis_torch}
+if numba is not None:
+    TRELLIS_BACKENDS["numba"] = _fill_trellis_numba
+
+
+def get_trellis_batch(
+    emissions: torch.Tensor,
+    tokens: list[list[int]],
+    num_frames: list[int],
+    blank_id: int = 0,
+    backend: str = "torch",
+    return_backpointers: bool = False,
+) -> list[torch.Tensor]:
+    """computes the trellises of a batch of segments at once,
+    with results identical to calling "get_trellis" for each segment
+
+    Args:
+        emissions (torch.Tensor): padded emissions of the batch (B x T x C) on cpu
+        tokens (list[list[int]]): token ids of each segment (lists or arrays)
+        num_frames (list[int]): number of valid frames of each segment
+        blank_id (int, optional): index of the blank token. Defaults to 0.
+        backend (str, optional): one of TRELLIS_BACKENDS. Defaults to "torch".
+        return_backpointers (bool, optional): whether to also record for each cell
+            if the best path changed token (1) or stayed (0). Defaults to False.
+
+    Returns:
+        list[torch.Tensor]: the trellis of each segment, (T_i + 1) x (L_i + 1),
+        and if return_backpointers, also a list with the uint8 backpointers of each
+        segment, of the same shape
+    """
+    if backend not in TRELLIS_BACKENDS:
+        raise ValueError(
+            f"Unknown trellis backend '{backend}', "
+            f"available: {list(TRELLIS_BACKENDS.keys())}"
+        )
+
+    num_tokens = [len(tkns) for tkns in tokens]
+    batch_size, max_frames, max_tokens = len(tokens), max(num_frames), max(num_tokens)
+
+    padded_tokens = torch.full((batch_size, max_tokens), blank_id, dtype=torch.long)
+    for b, tkns in enumerate(tokens):
+        padded_tokens[b, : len(tkns)] = torch.as_tensor(tkns, dtype=torch.long)
+
+    trellis = torch.full((batch_size, max_frames + 1, max_tokens + 1), -float("inf"))
+    trellis[:, :, 0] = 0
+    backpointers = None
+    if return_backpointers:
+        backpointers = torch.zeros(trellis.size(), dtype=torch.uint8)
+    TRELLIS_BACKENDS[backend](
+        trellis,
+        emissions[:, :max_frames].float(),
+        padded_tokens,
+        num_frames,
+        num_tokens,
+        blank_id,
+        backpointers,
+    )
+
+    trellises = [
+        trellis[b, : num_frames[b] + 1, : num_tokens[b] + 1] for b in range(batch_size)
+    ]
+    if not return_backpointers:
+        return trellises
+    return trellises, [
+        backpointers[b, : num_frames[b] + 1, : num_tokens[b] + 1]
+        for b in range(batch_size)
+    ]
+
+
+def get_backpointers(trellis, emission, tokens, blank_id=0):
+    """computes the backpointers of a filled trellis, for all the frames at once"""
+    # the trellis already holds the scores of the previous frames,
+    # so the "stayed" and "changed" scores do not depend on each other
+    stayed = trellis[:-1, 1:] + emission[: trellis.size(0) - 1, blank_id].unsqueeze(-1)
+    tokens = torch.as_tensor(tokens, dtype=torch.long)
+    changed = trellis[:-1, :-1] + emission[: trellis.size(0) - 1, tokens]
+    backpointers = torch.zeros(trellis.size(), dtype=torch.uint8)
+    backpointers[1:, 1:] = changed > stayed
+    return backpointers
+
+
+def backtrack(trellis, emission, tokens, blank_id=0, backpointers=None):
+    """adapted from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html
+    to walk on the backpointers of the trellis instead of recomputing the scores
+    of each step"""
     # Note:
     # j and t are indices for trellis, which has extra dimensions
     # for time and tokens at the beginning.
@@ -58,115 +360,400 @@ def backtrack(trellis, emission, tokens, blank_id=0):
     # the corresponding index in emission is `T-1`.
     # Similarly, when referring to token index `J` in trellis,
     # the corresponding index in transcript is `J-1`.
+    if backpointers is None:
+        backpointers = get_backpointers(trellis, emission, tokens, blank_id)
+    backpointers = backpointers.numpy()
+
     j = trellis.size(1) - 1
     t_start = torch.argmax(trellis[:, j]).item()
 
-    path = []
+    # token and time index in non-trellis coordinate, and if the token changed
+    token_index = np.empty(t_start, dtype=np.int64)
+    time_index = np.empty(t_start, dtype=np.int64)
+    changed = np.empty(t_start, dtype=bool)
+    n = 0
     for t in range(t_start, 0, -1):
-        # 1. Figure out if the current position was stay or change
-        # Note (again):
-        # `emission[J-1]` is the emission at time frame `J` of trellis dimension.
-        # Score for token staying the same from time frame J-1 to T.
-        stayed = trellis[t - 1, j] + emission[t - 1, blank_id]
-        # Score for token changing from C-1 at T-1 to J at T.
-        changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
-
-        # 2. Store the path with frame-wise probability.
-        prob = emission[t - 1, tokens[j - 1] if changed > stayed else 0].exp().item()
-        # Return token index and time index in non-trellis coordinate.
-        path.append(Point(j - 1, t - 1, prob))
-
-        # 3. Update the token
-        if changed > stayed:
+        token_index[n] = j - 1
+        time_index[n] = t - 1
+        changed[n] = backpointers[t, j]
+        n += 1
+        if changed[n - 1]:
             j -= 1
             if j == 0:
                 break
     else:
-        return []
-    return path[::-1]
+        return PointArray.empty()
 
+    return _make_path(
+        emission, tokens, token_index[:n], time_index[:n], changed[:n], blank_id
+    )
 
-def merge_repeats(path, txt):
-    """taken from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html"""
-    i1, i2 = 0, 0
-    segments = []
-    while i1 < len(path):
-        while i2 < len(path) and path[i1].token_index == path[i2].token_index:
-            i2 += 1
-        score = sum(path[k].score for k in range(i1, i2)) / (i2 - i1)
-        segments.append(
-            Segment(
-                txt[path[i1].token_index],
-                path[i1].time_index,
-                path[i2 - 1].time_index + 1,
-                score,
-            )
+
+def _make_path(emission, tokens, token_index, time_index, changed, blank_id):
+    """builds the path from the (reversed) steps of a backtracking walk"""
+    token_index = token_index[::-1].copy()
+    time_index = time_index[::-1].copy()
+    changed = changed[::-1]
+
+    # frame-wise probability of the token (if changed) or the blank (if stayed)
+    labels = np.where(
+        changed, np.asarray(tokens, dtype=np.int64)[token_index], blank_id
+    )
+    score = (
+        emission[torch.from_numpy(time_index), torch.from_numpy(labels)].exp().numpy()
+    )
+    return PointArray(token_index, time_index, score)
+
+
+def get_banded_trellis(emission, tokens, band_width, blank_id=0):
+    """computes only a diagonal band of the trellis, with memory that grows
+    with the number of frames times the width of the band
+
+    Args:
+        emission (torch.Tensor): emission of a segment (T x C)
+        tokens (list[int]): token ids of the segment
+        band_width (int): number of tokens to each side of the diagonal
+        blank_id (int, optional): index of the blank token. Defaults to 0.
+
+    Returns:
+        tuple[torch.Tensor, torch.Tensor, np.ndarray]: the band of the trellis
+        ((T + 1) x (width + 2), with a column of -inf on each side),
+        its backpointers ((T + 1) x width) and the first trellis column of the band
+        of each frame
+    """
+    num_frame, num_tokens = emission.size(0), len(tokens)
+    width = min(2 * band_width + 1, num_tokens + 1)
+
+    # the band follows the diagonal and moves at most one token per frame
+    centers = np.arange(num_frame + 1) * num_tokens // max(num_frame, 1)
+    band_starts = np.clip(centers - band_width, 0, num_tokens + 1 - width)
+    shifts = np.diff(band_starts).tolist()
+    band_starts_list = band_starts.tolist()
+
+    # trellis column j corresponds to token j - 1
+    padded_tokens = torch.tensor([blank_id] + list(tokens), dtype=torch.long)
+
+    band = torch.full((num_frame + 1, width + 2), -float("inf"))
+    band[0, 1] = 0
+    backpointers = torch.zeros((num_frame + 1, width), dtype=torch.uint8)
+    for t in range(num_frame):
+        shift, start = shifts[t], band_starts_list[t + 1]
+        stayed = band[t, 1 + shift : 1 + shift + width] + emission[t, blank_id]
+        changed = (
+            band[t, shift : shift + width]
+            + emission[t, padded_tokens[start : start + width]]
         )
-        i1 = i2
-    return segments
+        band[t + 1, 1 : width + 1] = torch.maximum(stayed, changed)
+        backpointers[t + 1] = changed > stayed
+        if start == 0:
+            band[t + 1, 1] = 0
+    return band, backpointers, band_starts
 
 
-def merge_words(segments: list[Segment], ofs: float, separator="|") -> list[Segment]:
-    """taken from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html"""
-    words = []
-    i1, i2 = 0, 0
-    while i1 < len(segments):
-        if i2 >= len(segments) or segments[i2].label == separator:
-            if i1 != i2:
-                segs = segments[i1:i2]
-                word = "".join([seg.label for seg in segs])
-                score = sum(seg.score * seg.length for seg in segs) / sum(
-                    seg.length for seg in segs
-                )
-                words.append(
-                    Segment(
-                        word,
-                        segments[i1].start / 50 + ofs,
-                        segments[i2 - 1].end / 50 + ofs,
-                        score,
-                    )
-                )
-            i1 = i2 + 1
-            i2 = i1
-        else:
-            i2 += 1
-    return words
+def backtrack_banded(
+    band, backpointers, band_starts, emission, tokens, blank_id=0
+) -> PointArray:
+    """backtracking on the output of "get_banded_trellis"
+
+    The alignment fails (empty path) when there is no path inside the band,
+    or when the path touches the edges of the band, where it might have been
+    cut off from a better path.
+    """
+    num_tokens, width = len(tokens), backpointers.size(1)
+    band_starts_list = band_starts.tolist()
+
+    # scores of the last token, for the frames whose band contains it
+    j = num_tokens
+    in_band = (band_starts <= j) & (j < band_starts + width)
+    final_scores = torch.full((band.size(0),), -float("inf"))
+    rows = torch.from_numpy(np.flatnonzero(in_band))
+    final_scores[rows] = band[rows, 1 + j - torch.from_numpy(band_starts)[rows]]
+    t_start = torch.argmax(final_scores).item()
+    if final_scores[t_start] == -float("inf"):
+        return PointArray.empty()
 
+    backpointers = backpointers.numpy()
+    token_index = np.empty(t_start, dtype=np.int64)
+    time_index = np.empty(t_start, dtype=np.int64)
+    changed = np.empty(t_start, dtype=bool)
+    n = 0
+    for t in range(t_start, 0, -1):
+        k = j - band_starts_list[t]
+        if (k == 0 and band_starts_list[t] > 0) or (k == width - 1 and j < num_tokens):
+            return PointArray.empty()
+        token_index[n] = j - 1
+        time_index[n] = t - 1
+        changed[n] = backpointers[t, k]
+        n += 1
+        if changed[n - 1]:
+            j -= 1
+            if j == 0:
+                break
+    else:
+        return PointArray.empty()
+
+    return _make_path(
+        emission, tokens, token_index[:n], time_index[:n], changed[:n], blank_id
+    )
+
+
+def trellis_size_mb(num_frames: int, num_tokens: int) -> float:
+    """memory of a trellis and its backpointers (float32 + uint8) in MB"""
+    return (num_frames + 1) * (num_tokens + 1) * 5 / 1024**2
+
+
+def align_long(
+    emission, tokens, band_width, max_trellis_mb, blank_id=0, backend="torch"
+) -> PointArray:
+    """memory-bounded alignment for long segments: tries a banded trellis first,
+    and falls back to the exact trellis when the band fails and the exact trellis
+    fits in the memory budget
+
+    Args:
+        emission (torch.Tensor): emission of a segment (T x C)
+        tokens (list[int]): token ids of the segment
+        band_width (int): number of tokens to each side of the diagonal
+        max_trellis_mb (float): memory budget for the trellis in MB
+        blank_id (int, optional): index of the blank token. Defaults to 0.
+        backend (str, optional): trellis backend for the exact fallback
 
-def merge_original(segments: list[Segment]) -> list[Segment]:
+    Returns:
+        PointArray: the path (empty if the alignment failed)
+    """
+    num_frame, num_tokens = emission.size(0), len(tokens)
+    if num_tokens > num_frame:
+        return PointArray.empty()
+
+    # narrower band if needed to stay within the budget
+    max_width = int(max_trellis_mb * 1024**2 / (5 * (num_frame + 1))) - 2
+    band_width = min(band_width, (max_width - 1) // 2)
+    if band_width > 0:
+        band, backpointers, band_starts = get_banded_trellis(
+            emission, tokens, band_width, blank_id
+        )
+        path = backtrack_banded(
+            band, backpointers, band_starts, emission, tokens, blank_id
+        )
+        del band, backpointers
+        if len(path):
+            return path
+
+    if trellis_size_mb(num_frame, num_tokens) > max_trellis_mb:
+        return PointArray.empty()
+    trellises, backpointers = get_trellis_batch(
+        emission.unsqueeze(0),
+        [tokens],
+        [num_frame],
+        blank_id,
+        backend,
+        return_backpointers=True,
+    )
+    return backtrack(trellises[0], emission, tokens, blank_id, backpointers[0])
+
+
+def compress_blank_frames(
+    emission: torch.Tensor, threshold: float, blank_id: int = 0
+) -> tuple[torch.Tensor, np.ndarray]:
+    """collapses each run of high-confidence blank frames into a single super-frame
+
+    The emission of a super-frame is the score of staying on blank for all its frames,
+    and for each token, the score of emitting the token once (at its best frame)
+    and blank for the rest. Frames that are not in a run are kept as they are.
+
+    Args:
+        emission (torch.Tensor): emission of a segment (T x C)
+        threshold (float): minimum blank probability of a frame to be collapsed
+        blank_id (int, optional): index of the blank token. Defaults to 0.
+
+    Returns:
+        tuple[torch.Tensor, np.ndarray]: the compressed emission (T' x C) and
+        the frame boundaries of the super-frames (T' + 1)
+    """
+    emission_np = emission.numpy()
+    blank = emission_np[:, blank_id]
+    is_blank = blank > np.log(threshold)
+
+    # a new super-frame starts at every frame, except inside a run of blanks
+    starts = np.flatnonzero(~(is_blank & np.append(False, is_blank[:-1])))
+    frame_bounds = np.append(starts, len(blank))
+    lengths = np.diff(frame_bounds)
+
+    compressed = np.maximum.reduceat(emission_np - blank[:, None], starts, axis=0)
+    blank_sums = np.add.reduceat(blank, starts)
+    compressed += blank_sums[:, None]
+    compressed[:, blank_id] = blank_sums
+    # frames that are not collapsed keep their exact emission
+    singles = lengths == 1
+    compressed[singles] = emission_np[starts[singles]]
+
+    return torch.from_numpy(compressed), frame_bounds
+
+
+def expand_path(
+    path: PointArray,
+    emission: torch.Tensor,
+    tokens: list[int],
+    frame_bounds: np.ndarray,
+    blank_id: int = 0,
+) -> PointArray:
+    """maps the path found on a compressed emission back to the original frames
+
+    Args:
+        path (PointArray): path on the compressed emission
+        emission (torch.Tensor): the original (uncompressed) emission
+        tokens (list[int]): token ids of the segment
+        frame_bounds (np.ndarray): output of "compress_blank_frames"
+        blank_id (int, optional): index of the blank token. Defaults to 0.
+
+    Returns:
+        PointArray: the path on the original frames
+    """
+    if not len(path):
+        return path
+
+    token_ids = np.asarray(tokens, dtype=np.int64)
+    changed = np.diff(path.token_index, prepend=-1) != 0
+    starts = frame_bounds[path.time_index]
+    ends = frame_bounds[path.time_index + 1]
+
+    # frame of each super-frame where the token is emitted
+    cuts = starts.copy()
+    for n in np.flatnonzero(changed & (ends - starts > 1)).tolist():
+        frames = emission[starts[n] : ends[n]]
+        gains = frames[:, token_ids[path.token_index[n]]] - frames[:, blank_id]
+        cuts[n] += torch.argmax(gains).item()
+
+    # the frames before the cut still belong to the previous token,
+    # apart from the ones before the first token
+    before = cuts - starts
+    before[0] = 0
+    piece_tokens = np.stack([path.token_index - 1, path.token_index], 1).ravel()
+    piece_starts = np.stack([starts, cuts], 1).ravel()
+    piece_lengths = np.stack([before, ends - cuts], 1).ravel()
+
+    total = piece_lengths.sum()
+    piece_offsets = np.cumsum(piece_lengths) - piece_lengths
+    token_index = np.repeat(piece_tokens, piece_lengths)
+    time_index = np.repeat(piece_starts - piece_offsets, piece_lengths) + np.arange(
+        total
+    )
+
+    labels = np.full(total, blank_id)
+    change_frames = np.isin(time_index, cuts[changed])
+    labels[change_frames] = token_ids[token_index[change_frames]]
+    score = (
+        emission[torch.from_numpy(time_index), torch.from_numpy(labels)].exp().numpy()
+    )
+    return PointArray(token_index, time_index, score)
+
+
+def _group_bounds(group_starts: np.ndarray, n: int) -> np.ndarray:
+    """the end (exclusive) of each group, given the start of each group"""
+    return np.append(group_starts[1:], n)
+
+
+def merge_repeats(path: PointArray, txt: str) -> SegmentArray:
+    """adapted from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html
+    to group the consecutive frames of each token at once"""
+    if not len(path):
+        return SegmentArray.empty()
+    starts = np.flatnonzero(np.diff(path.token_index, prepend=-1))
+    ends = _group_bounds(starts, len(path))
+    score = np.add.reduceat(path.score.astype(np.float64), starts) / (ends - starts)
+    return SegmentArray.from_lists(
+        path.time_index[starts],
+        path.time_index[ends - 1] + 1,
+        score,
+        [txt[k] for k in path.token_index[starts].tolist()],
+    )
+
+
+def merge_words(segments: SegmentArray, ofs: float, separator="|") -> SegmentArray:
+    """adapted from https://pytorch.org/audio/main/tutorials/forced_alignment_tutorial.html
+    to group the segments between separators at once"""
+    is_separator = segments.label_mask(separator)
+    # indices of the non-separator segments and the word each one belongs to
+    indices = np.flatnonzero(~is_separator)
+    if not len(indices):
+        return SegmentArray.empty()
+    word_ids = np.cumsum(is_separator)[indices]
+    starts = np.flatnonzero(np.diff(word_ids, prepend=-1))
+    first, last = indices[starts], indices[_group_bounds(starts, len(indices)) - 1]
+
+    lengths = segments.length[indices]
+    score = np.add.reduceat(
+        segments.score[indices] * lengths, starts
+    ) / np.add.reduceat(lengths, starts)
+
+    # the labels of consecutive segments are contiguous in the buffer
+    label_offsets = segments.label_offsets.tolist()
+    words = [
+        segments.label_buffer[label_offsets[i] : label_offsets[j + 1]]
+        for i, j in zip(first.tolist(), last.tolist())
+    ]
+    return SegmentArray.from_lists(
+        segments.start[first] / 50 + ofs,
+        segments.end[last] / 50 + ofs,
+        score,
+        words,
+    )
+
+
+def merge_original(segments: SegmentArray) -> SegmentArray:
     """merges neighbouring segments according their original text
 
     Args:
-        segments (list[Segment]): list of Segment objects (output of "merge_words")
+        segments (SegmentArray): output of "merge_words" with original labels
 
     Returns:
-        list[Segment]: new (merged) list of Segments
+        SegmentArray: new (merged) segments
     """
-    new_segments = []
+    if not len(segments):
+        return segments
+
+    # a group continues while the original label of a segment
+    # is one of the original tokens of the first segment of the group
+    original_labels = segments.original_labels
+    group_starts = []
     i = 0
     while i < len(segments):
+        group_starts.append(i)
+        original_tokens = original_labels[i].split()
         j = i + 1
-        start = segments[i].start
-        end = segments[i].end
-        scores = [segments[i].score]
-        labels = [segments[i].label]
-        original_labels = segments[i].original_label.split()
-        while j < len(segments) and segments[j].original_label in original_labels:
-            end = segments[j].end
-            scores.append(segments[j].score)
-            labels.append(segments[j].label)
+        while j < len(segments) and original_labels[j] in original_tokens:
             j += 1
-        new_segments.append(
-            Segment(
-                "|".join(labels),
-                start,
-                end,
-                sum(scores) / len(scores),
-                " ".join(original_labels),
-            )
-        )
         i = j
-    return new_segments
+    starts = np.array(group_starts)
+    ends = _group_bounds(starts, len(segments))
+
+    labels = segments.labels
+    return SegmentArray.from_lists(
+        segments.start[starts],
+        segments.end[ends - 1],
+        np.add.reduceat(segments.score, starts) / (ends - starts),
+        ["|".join(labels[i:j]) for i, j in zip(group_starts, ends.tolist())],
+        [" ".join(original_labels[i].split()) for i in group_starts],
+    )
+
+
+# original tokens to each side of the diagonal in "get_monolingual_alignments_dp"
+# (doubled while the best path touches the edge of the band)
+MONOLINGUAL_BAND_WIDTH = 10
+# maximum cells of its tables, beyond which it falls back to the greedy scan
+MONOLINGUAL_MAX_CELLS = 2**22
+# score of aligning a clean token to the same original token as the previous one,
+# so that one-to-one alignments are preferred when they are as good
+REPEAT_PENALTY = 0.01
+# moves of the dynamic programming of "get_monolingual_alignments_dp"
+_DIAGONAL_FROM_MATCHED, _DIAGONAL_FROM_SKIPPED, _REPEAT = 0, 1, 2
+_SKIP_FROM_MATCHED, _SKIP_FROM_SKIPPED = 3, 4
+
+
+def normalize_original_token(token: str, lang: str) -> str:
+    """an original text token as it is compared to the clean tokens"""
+    token = text_cleaning.handle_html_non_utf(token, lang)
+    token = text_cleaning.my_num2words(token, lang)
+    return token.lower()
 
 
 def get_monolingual_alignments(
@@ -185,16 +772,6 @@ def get_monolingual_alignments(
             string of the original text
     """
 
-    def get_original(idx=None, token=None):
-        if token is None:
-            token = original_tokens[idx]
-        token = text_cleaning.handle_html_non_utf(token, lang)
-        token = text_cleaning.my_num2words(token, lang)
-        return token.lower()
-
-    def get_clean(idx):
-        return clean_tokens[idx].lower()
-
     def add_alignment(alignment, i, token_j):
         if i in alignment.keys():
             alignment[i].append(token_j)
@@ -206,19 +783,23 @@ def get_monolingual_alignments(
         alignment = {0: " ".join(original_tokens)}
         return alignment
 
+    # each token is normalized only once, and not in every comparison
+    normalized = [normalize_original_token(token, lang) for token in original_tokens]
+    normalized_by_token = dict(zip(original_tokens, normalized))
+    lower_clean = [token.lower() for token in clean_tokens]
+
     alignment = {}
     j1, j2, i = 0, 0, 0
     while i < len(clean_tokens):
         queue = []
-        original_tokens_iter = list(range(len(original_tokens)))[j1:]
-        for j1 in original_tokens_iter:
-            if i < len(clean_tokens) and get_clean(i) in get_original(j1):
+        for j1 in range(j1, len(original_tokens)):
+            if i < len(clean_tokens) and lower_clean[i] in normalized[j1]:
                 queue.append(j1)
                 for j2 in queue:
                     alignment = add_alignment(alignment, i, original_tokens[j2])
                 queue = []
                 i += 1
-                while i < len(clean_tokens) and get_clean(i) in get_original(j1):
+                while i < len(clean_tokens) and lower_clean[i] in normalized[j1]:
                     alignment = add_alignment(alignment, i, original_tokens[j1])
                     i += 1
             else:
@@ -232,10 +813,10 @@ def get_monolingual_alignments(
         if len(clean_token) < 3:
             if len(alignment[i + 1]) > 1:
                 score = fuzz.ratio(
-                    get_original(token=alignment[i][-1]), clean_token.lower()
+                    normalized_by_token[alignment[i][-1]], lower_clean[i]
                 )
                 score_next = fuzz.ratio(
-                    get_original(token=alignment[i + 1][0]), clean_token.lower()
+                    normalized_by_token[alignment[i + 1][0]], lower_clean[i]
                 )
                 if score_next > score:
                     alignment[i][-1] = alignment[i + 1][0]
@@ -245,3 +826,218 @@ def get_monolingual_alignments(
         alignment[k] = " ".join(v)
 
     return alignment
+
+
+def _band_similarities(
+    lower_clean: list[str], normalized: list[str], starts: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    """similarity of each clean token (row i, from 1) to the normalized original
+    tokens of its band (j from starts[i] to ends[i], from 1): 1 if the clean token
+    is part of it (as in "get_monolingual_alignments"), and their Levenshtein
+    ratio otherwise, computed once for each pair of distinct tokens"""
+    clean_vocab, clean_ids = np.unique(lower_clean, return_inverse=True)
+    original_vocab, original_ids = np.unique(normalized, return_inverse=True)
+    columns = starts[1:, None] + np.arange((ends - starts).max())
+    in_band = (columns >= 1) & (columns < ends[1:, None])
+    rows = np.broadcast_to(np.arange(len(lower_clean))[:, None], in_band.shape)
+    pairs = (
+        clean_ids[rows[in_band]] * len(original_vocab)
+        + original_ids[columns[in_band] - 1]
+    )
+    unique_pairs, pair_ids = np.unique(pairs, return_inverse=True)
+    pair_similarities = np.array(
+        [
+            1.0 if clean_token in token else Levenshtein.ratio(clean_token, token)
+            for clean_token, token in zip(
+                clean_vocab[unique_pairs // len(original_vocab)],
+                original_vocab[unique_pairs % len(original_vocab)],
+            )
+        ]
+    )
+    similarities = np.zeros((len(lower_clean) + 1, columns.shape[1]))
+    similarities[1:][in_band] = pair_similarities[pair_ids]
+    return similarities
+
+
+def _fill_monolingual_tables(
+    similarities, starts, ends, matched, skipped, matched_moves, skipped_moves
+):
+    """fills the tables of "get_monolingual_alignments_dp" (in-place): the best
+    score of the first i clean and j original tokens, with the last original token
+    aligned to the last clean token (matched) or not (skipped), and the move that
+    led to it, by row and within the band (k = j - starts[i])"""
+    skipped[0, 0] = 0.0
+    for i in range(similarities.shape[0]):
+        start, end = starts[i], ends[i]
+        if i > 0:
+            prev_start, prev_end = starts[i - 1], ends[i - 1]
+            for j in range(max(start, 1), end):
+                score, move = -np.inf, -1
+                # the previous clean token with the previous original token
+                if prev_start <= j - 1 < prev_end:
+                    score = matched[i - 1, j - 1 - prev_start]
+                    move = _DIAGONAL_FROM_MATCHED
+                    if skipped[i - 1, j - 1 - prev_start] > score:
+                        score = skipped[i - 1, j - 1 - prev_start]
+                        move = _DIAGONAL_FROM_SKIPPED
+                # or with the same original token
+                if (
+                    prev_start <= j < prev_end
+                    and matched[i - 1, j - prev_start] - REPEAT_PENALTY > score
+                ):
+                    score = matched[i - 1, j - prev_start] - REPEAT_PENALTY
+                    move = _REPEAT
+                if move >= 0:
+                    matched[i, j - start] = score + similarities[i, j - start]
+                    matched_moves[i, j - start] = move
+        for k in range(1, end - start):
+            if matched[i, k - 1] >= skipped[i, k - 1]:
+                skipped[i, k] = matched[i, k - 1]
+                skipped_moves[i, k] = _SKIP_FROM_MATCHED
+            else:
+                skipped[i, k] = skipped[i, k - 1]
+                skipped_moves[i, k] = _SKIP_FROM_SKIPPED
+
+
+if numba is not None:
+    _fill_monolingual_tables = numba.njit(cache=True)(_fill_monolingual_tables)
+
+
+def _banded_monolingual_path(
+    lower_clean: list[str], normalized: list[str], band_width: int
+) -> tuple[list[list[int]], bool]:
+    """the best path of the dynamic programming of "get_monolingual_alignments_dp"
+    within a band around the diagonal
+
+    Returns:
+        tuple[list[list[int]], bool]: the clean tokens aligned to each original
+        token (none if it is skipped), and whether the path touches the edge of
+        the band (so that a wider band could give a better one)
+    """
+    num_clean, num_original = len(lower_clean), len(normalized)
+    centers = np.arange(num_clean + 1) * num_original // num_clean
+    starts = np.maximum(0, centers - band_width)
+    ends = np.minimum(num_original, centers + band_width) + 1
+
+    similarities = _band_similarities(lower_clean, normalized, starts, ends)
+    matched = np.full(similarities.shape, -np.inf)
+    skipped = np.full(similarities.shape, -np.inf)
+    matched_moves = np.full(similarities.shape, -1, dtype=np.int8)
+    skipped_moves = np.full(similarities.shape, -1, dtype=np.int8)
+    _fill_monolingual_tables(
+        similarities, starts, ends, matched, skipped, matched_moves, skipped_moves
+    )
+
+    aligned_clean = [[] for _ in range(num_original)]
+    touches_edge = False
+    i, j = num_clean, num_original
+    k = j - starts[i]
+    is_matched = matched[i, k] >= skipped[i, k]
+    while i > 0 or j > 0:
+        k = j - starts[i]
+        touches_edge |= (k == 0 and starts[i] > 0) or (
+            j == ends[i] - 1 and j < num_original
+        )
+        if is_matched:
+            aligned_clean[j - 1].append(i - 1)
+            move = matched_moves[i, k]
+            is_matched = move != _DIAGONAL_FROM_SKIPPED
+            i -= 1
+            if move != _REPEAT:
+                j -= 1
+        else:
+            is_matched = skipped_moves[i, k] == _SKIP_FROM_MATCHED
+            j -= 1
+    return aligned_clean, touches_edge
+
+
+def get_monolingual_alignments_dp(
+    original_tokens: list[str],
+    clean_tokens: list[str],
+    lang: str,
+    band_width: int = MONOLINGUAL_BAND_WIDTH,
+) -> dict[int, str]:
+    """finds mappings from the clean (ASR-like output) tokens to the original
+    (unmodified) text tokens, as "get_monolingual_alignments", with a banded
+    dynamic programming over the normalized tokens, in O(n * band_width).
+
+    Each clean token is aligned to an original token, in order, maximizing the
+    similarity of the aligned tokens. Consecutive clean tokens can be aligned to
+    the same original token (e.g. a spelled-out number), and the original tokens
+    that are not aligned (e.g. removed events and speaker names) go with the next
+    aligned clean token (or with the last ones, at the end). A repeated original
+    token goes with the first clean token of the repetition, since they are
+    merged by "merge_original".
+
+    The band is doubled while the best path touches its edge (e.g. when the
+    cleaning removed a block of tokens wider than the band), and if its tables
+    would have more than MONOLINGUAL_MAX_CELLS cells, the greedy scan is used.
+
+    Args:
+        original_tokens (list[str]): original tokens for a segment
+        clean_tokens (list[str]): clean tokens for a segment
+        lang (str): language id of the segment
+        band_width (int, optional): original tokens to each side of the diagonal
+            (at least the ratio of original to clean tokens)
+
+    Returns:
+        dict[int, str]: index of the clean tokens to the corresponding
+            string of the original text
+    """
+    if clean_tokens == [""]:
+        return {0: " ".join(original_tokens)}
+    num_clean, num_original = len(clean_tokens), len(original_tokens)
+    if not num_original:
+        return {i: "" for i in range(num_clean)}
+
+    normalized = [normalize_original_token(token, lang) for token in original_tokens]
+    lower_clean = [token.lower() for token in clean_tokens]
+
+    band_width = max(band_width, -(-num_original // num_clean) + 1)
+    while True:
+        if (num_clean + 1) * (2 * band_width + 1) > MONOLINGUAL_MAX_CELLS:
+            return get_monolingual_alignments(original_tokens, clean_tokens, lang)
+        aligned_clean, touches_edge = _banded_monolingual_path(
+            lower_clean, normalized, band_width
+        )
+        # a band over all the original tokens has no edges
+        if not touches_edge:
+            break
+        band_width *= 2
+
+    # original tokens (by index) of each clean token
+    alignment, queue = {}, []
+    for j, clean_indices in enumerate(aligned_clean):
+        if not clean_indices:
+            queue.append(j)
+            continue
+        for i in reversed(clean_indices):
+            alignment[i] = queue + [j]
+            queue = []
+
+    # "merge_original" merges a clean token into the previous ones if its original
+    # string is one of their original tokens, which would drop a repeated word
+    # ("the the"), so the repeated one is added to the first clean token instead
+    # (as the original tokens at the end, which would be repeated otherwise)
+    group = alignment[0]
+    for i in range(1, num_clean):
+        indices = alignment[i]
+        if len(indices) == 1 and original_tokens[indices[0]] in [
+            original_tokens[j] for j in group
+        ]:
+            if indices[0] not in group:
+                group.append(indices[0])
+        else:
+            group = indices
+    group.extend(queue)
+
+    return {
+        i: " ".join(original_tokens[j] for j in indices)
+        for i, indices in alignment.items()
+    }
+
+
+TEXT_ALIGNERS = {
+    "greedy": get_monolingual_alignments,
+    "dp": get_monolingual_alignments_dp,
+}
@@ -5,6 +5,7 @@ from tqdm import tqdm
 
 import yaml
 import numpy as np
+from stream_log import STREAM_LOG_NAME, follow_stream_log
 
 
 def is_empty(txt: str) -> bool:
@@ -52,47 +53,75 @@ def remove_failed(segments: list[dict], failed_segments: list[dict]) -> list[dic
     if not failed_segments:
         return segments
 
-    new_segments = []
-    for sgm in segments:
-        is_ok = True
-        for failed_sgm in failed_segments:
-            if overlaps(
-                sgm["offset"],
-                sgm["offset"] + sgm["duration"],
-                failed_sgm["start"],
-                failed_sgm["end"],
-            ):
-                is_ok = False
-                break
+    # interval index of the failed segments: their starts (sorted), with the maximum
+    # end of the ones that start before each one, and the minimum of the ones after
+    failed_starts = np.array([failed_sgm["start"] for failed_sgm in failed_segments])
+    failed_ends = np.array([failed_sgm["end"] for failed_sgm in failed_segments])
+    order = np.argsort(failed_starts)
+    failed_starts, failed_ends = failed_starts[order], failed_ends[order]
+    max_ends = np.concatenate([[-np.inf], np.maximum.accumulate(failed_ends)])
+    min_ends = np.concatenate(
+        [np.minimum.accumulate(failed_ends[::-1])[::-1], [np.inf]]
+    )
 
-        if is_ok:
-            new_segments.append(sgm)
+    starts = np.array([sgm["offset"] for sgm in segments], dtype=float)
+    ends = starts + np.array([sgm["duration"] for sgm in segments], dtype=float)
+    # the three cases of "overlaps": a failed segment contains the start of the
+    # segment, or its end, or is contained in it
+    contains_start = max_ends[np.searchsorted(failed_starts, starts, "right")] > starts
+    contains_end = max_ends[np.searchsorted(failed_starts, ends, "right")] > ends
+    is_contained = min_ends[np.searchsorted(failed_starts, starts, "left")] < ends
+    is_ok = ~(contains_start | contains_end | is_contained)
+
+    return [sgm for sgm, sgm_is_ok in zip(segments, is_ok) if sgm_is_ok]
+
+
+class WordSegmentIndex:
+    def __init__(self, word_segments: list[dict]):
+        """the word segments of a talk, sorted by their start, with the arrays
+        to find the ones of a new segment with binary searches
+
+        Args:
+            word_segments (list[dict]): result of the forced alignment
+        """
+        self.word_segments = sort_segments(word_segments)
+        self.starts = np.array(
+            [word_sgm["start"] for word_sgm in self.word_segments], dtype=float
+        )
+        # maximum end of the words up to each one, which is sorted
+        self.max_ends = np.maximum.accumulate(
+            np.array([word_sgm["end"] for word_sgm in self.word_segments], dtype=float)
+        )
 
-    return new_segments
+    def find(self, start: float, end: float) -> list[dict]:
+        """the words that start inside (start, end), up to the first word
+        that ends at or after end (included)"""
+        first = np.searchsorted(self.starts, start, "right")
+        last = min(
+            np.searchsorted(self.starts, end, "left"),
+            np.searchsorted(self.max_ends, end, "left") + 1,
+        )
+        return self.word_segments[first:last]
 
 
-def get_text_for_segment(segment: dict, word_segments: list[dict]) -> tuple[str, str]:
+def get_text_for_segment(
+    segment: dict, word_index: WordSegmentIndex
+) -> tuple[str, str]:
     """finds the text that corresponds to this new segment based on the word_segments
     from the forced alignment
 
     Args:
         segment (dict): a segment from the new SHAS segmentation
-        word_segments (list[dict]): result of the forced alignment
+        word_index (WordSegmentIndex): result of the forced alignment
 
     Returns:
         tuple[str, str]: the clean (ASR-like) and original text that correspond to the segment
     """
     start = segment["offset"]
     end = segment["offset"] + segment["duration"]
-    clean, original = [], []
-    for word_sgm in word_segments:
-        if word_sgm["start"] > start and word_sgm["start"] < end:
-            clean.append(word_sgm["word"])
-            original.append(word_sgm["text"])
-        if word_sgm["end"] >= end:
-            break
-    clean = " ".join(clean)
-    original = " ".join(original)
+    word_segments = word_index.find(start, end)
+    clean = " ".join(word_sgm["word"] for word_sgm in word_segments)
+    original = " ".join(word_sgm["text"] for word_sgm in word_segments)
     return clean, original
 
 
@@ -170,6 +199,34 @@ def post_process_text(txt: str) -> str:
     return txt
 
 
+def get_texts_for_talk(
+    talk_segments: list[dict], forced_alignment_out: dict
+) -> list[tuple[str, str, str, dict]]:
+    """finds the text of the new segments of a talk
+
+    Args:
+        talk_segments (list[dict]): segments of the talk in the new segmentation
+        forced_alignment_out (dict): output of get_word_segments.py for the talk
+
+    Returns:
+        list[tuple[str, str, str, dict]]: the clean, original and post-processed
+            text of each segment with some text, and the segment
+    """
+    word_index = WordSegmentIndex(forced_alignment_out["word_segments"])
+
+    failed_segments = forced_alignment_out["failed_segments"]
+    talk_segments = remove_failed(talk_segments, failed_segments)
+
+    texts = []
+    for segment in talk_segments:
+        asr_txt, reconstructed_txt = get_text_for_segment(segment, word_index)
+        reconstructed_txt_post = post_process_text(reconstructed_txt)
+
+        if reconstructed_txt_post:
+            texts.append((asr_txt, reconstructed_txt, reconstructed_txt_post, segment))
+    return texts
+
+
 def align_audio_source(args):
     path_to_new_yaml = Path(args.path_to_new_yaml)
     with open(path_to_new_yaml) as f:
@@ -188,36 +245,42 @@ def align_audio_source(args):
 
     extra = 0 if args.no_extra else 0.06
 
-    asr_transcript = []
-    reconstructed_transcript = []
-    reconstructed_transcript_post = []
-    segmentation_post = []
-    for talk_id, talk_segments in tqdm(segments_per_talk.items()):
+    def load_talk(talk_id: str) -> list[tuple[str, str, str, dict]]:
         alignment_file = dir / f"{talk_id}.json"
         if alignment_file.exists():
             with open(alignment_file) as f:
                 forced_alignment_out = json.load(f)
         else:
             print(f"{alignment_file} not found. Skipping.")
-            continue
-
-        word_segments = forced_alignment_out["word_segments"]
-        word_segments = sort_segments(word_segments)
-
-        failed_segments = forced_alignment_out["failed_segments"]
-        talk_segments = remove_failed(talk_segments, failed_segments)
-
-        for segment in talk_segments:
-            asr_txt, reconstructed_txt = get_text_for_segment(segment, word_segments)
-            reconstructed_txt_post = post_process_text(
-                reconstructed_txt, args.source_language
-            )
-
-            if reconstructed_txt_post:
-                asr_transcript.append(asr_txt)
-                reconstructed_transcript.append(reconstructed_txt)
-                reconstructed_transcript_post.append(reconstructed_txt_post)
-                segmentation_post.append(segment)
+            return []
+        return get_texts_for_talk(segments_per_talk[talk_id], forced_alignment_out)
+
+    texts_per_talk = {}
+    with tqdm(total=len(segments_per_talk)) as progress_bar:
+        if args.follow:
+            # the talks as they are written by get_word_segments.py --stream-log
+            for talk_id in follow_stream_log(
+                dir / STREAM_LOG_NAME, producer_pid=args.producer_pid
+            ):
+                if talk_id in segments_per_talk and talk_id not in texts_per_talk:
+                    texts_per_talk[talk_id] = load_talk(talk_id)
+                    progress_bar.update()
+        for talk_id in segments_per_talk.keys():
+            if talk_id not in texts_per_talk:
+                texts_per_talk[talk_id] = load_talk(talk_id)
+                progress_bar.update()
+
+    # in the order of the new segmentation, whatever the order of the talks in the log
+    asr_transcript = []
+    reconstructed_transcript = []
+    reconstructed_transcript_post = []
+    segmentation_post = []
+    for talk_id in segments_per_talk.keys():
+        for asr_txt, txt, post_txt, segment in texts_per_talk[talk_id]:
+            asr_transcript.append(asr_txt)
+            reconstructed_transcript.append(txt)
+            reconstructed_transcript_post.append(post_txt)
+            segmentation_post.append(segment)
 
     for i in range(len(segmentation_post)):
         segmentation_post[i]["offset"] = round(
@@ -251,6 +314,10 @@ if __name__ == "__main__":
     )
     parser.add_argument("--source-language", "-lang", type=str, required=True)
     parser.add_argument("--no-extra", action="store_true")
+    # process the talks while get_word_segments.py --stream-log is writing them
+    parser.add_argument("--follow", action="store_true")
+    # pid of get_word_segments.py, to stop following its log if it exits
+    parser.add_argument("--producer-pid", type=int, default=None)
     args = parser.parse_args()
 
     align_audio_source(args)
@@ -1,14 +1,30 @@
 import argparse
 import json
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict, deque
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
 
 import forced_alignment
 import numpy as np
 import text_cleaning
 import torch
-import torchaudio
 import yaml
+from alignment_client import request_alignment
+from alignment_store import AlignmentStore, talk_key
+from audio_loading import BatchBuilder, TalkAudio, to_float32
 from constants import SR, WAV2VEC_MODEL_NAME, N
+from emission_cache import EMISSION_DTYPE, EmissionCache, file_digest
+from onnx_model import DEFAULT_ONNX_DIR, OnnxModel, export_onnx
+from stream_log import STREAM_LOG_NAME, StreamLog
+from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import DataLoader, Dataset, Sampler
 from tqdm import tqdm
 from transformers import (
@@ -27,6 +43,9 @@ class WavDataset(Dataset):
         vocab: dict,
         lang: str,
         max_seconds_example: float,
+        emission_cache: EmissionCache = None,
+        load_audio: bool = True,
+        cleaned_texts: dict[str, str] = None,
     ):
         """dataset object for the original segments of a wav file
 
@@ -35,6 +54,12 @@ class WavDataset(Dataset):
             segments (list[dict]): original segmentation for the wav file
             vocab (dict): vocabulary of wav2vec2.0 with mappings from chars to indices
             max_seconds_example (float): max length of an example
+            emission_cache (EmissionCache, optional): the audio of the segments
+                with cached emissions is not loaded
+            load_audio (bool, optional): if False, only the texts of the segments
+                are loaded (for emissions that are sliced from those of the talk)
+            cleaned_texts (dict[str, str], optional): cleaned text of each original
+                text (from "text_cleaning.clean_texts"), if they are already cleaned
         """
         super().__init__()
 
@@ -43,9 +68,14 @@ class WavDataset(Dataset):
         self.vocab = vocab
         self.lang = lang
         self.max_seconds_example = max_seconds_example
+        self.emission_cache = emission_cache
+        self.load_audio = load_audio
+        self.cleaned_texts = cleaned_texts
+        self._audio = None
 
         self._filter_items()
         self._sort_items()
+        self._plan_items()
 
     def _filter_items(self):
         """removes long segments"""
@@ -75,9 +105,77 @@ class WavDataset(Dataset):
         durations = [sgm["duration"] for sgm in self.segments]
         self.segments = [self.segments[idx] for idx in np.argsort(durations)][::-1]
 
+    def _plan_items(self):
+        """tokenizes the texts of the examples, and finds the output of the
+        examples that do not need the model: those with an empty text, and those
+        with more tokens than frames, whose alignment would fail"""
+        if self.cleaned_texts is not None:
+            cleaned_txts = [self.cleaned_texts[sgm["text"]] for sgm in self.segments]
+        else:
+            cleaned_txts = text_cleaning.clean_texts(
+                [sgm["text"] for sgm in self.segments], self.lang
+            )
+        text_tokenizer = text_cleaning.TextTokenizer.for_vocab(self.vocab, self.lang)
+        self.tokenized_cleaned_txts = [
+            text_tokenizer.tokenize(cleaned_txt) for cleaned_txt in cleaned_txts
+        ]
+        # the token ids of the trellis
+        self.token_ids = [
+            text_tokenizer.encode(txt) for txt in self.tokenized_cleaned_txts
+        ]
+
+        # indices of the examples to align, and the output of the rest
+        self.to_align, self.planned_results = [], {}
+        self.num_empty, self.num_infeasible = 0, 0
+        for idx, (sgm, txt) in enumerate(
+            zip(self.segments, self.tokenized_cleaned_txts)
+        ):
+            # an upper bound of the frames of the example in any emission mode,
+            # (the trellis needs a frame for each token, with no blanks in between)
+            max_frames = int(sgm["duration"] * SR) // N + 1
+            if txt == "":
+                self.planned_results[idx] = get_word_segments_for_empty_text(
+                    sgm["text"], sgm["offset"], sgm["duration"], self.lang
+                )
+                self.num_empty += 1
+            elif len(txt) > max_frames:
+                self.planned_results[idx] = {
+                    "start": sgm["offset"],
+                    "end": sgm["offset"] + sgm["duration"],
+                    "flag": "failed",
+                    "text": sgm["text"],
+                }
+                self.num_infeasible += 1
+            else:
+                self.to_align.append(idx)
+
+    def plan_counts(self) -> dict:
+        """the examples (and seconds of audio) that do not need the model
+        (see "format_plan_summary")"""
+        return {
+            "segments": len(self.segments),
+            "empty": self.num_empty,
+            "infeasible": self.num_infeasible,
+            "seconds": sum(sgm["duration"] for sgm in self.segments),
+            "planned_seconds": sum(
+                self.segments[idx]["duration"] for idx in self.planned_results
+            ),
+        }
+
     def __len__(self):
         return len(self.segments)
 
+    @property
+    def audio(self) -> TalkAudio:
+        """the audio of the talk (opened only once, when it is first needed)"""
+        if self._audio is None:
+            self._audio = TalkAudio(self.path_to_wav)
+        return self._audio
+
+    def release_audio(self):
+        """closes the audio of the talk (it is opened again if it is needed)"""
+        self._audio = None
+
     def __getitem__(self, indices: list[int]) -> tuple:
         """returns the batch for a list of indices"""
 
@@ -85,29 +183,49 @@ class WavDataset(Dataset):
         durations = [self.segments[index]["duration"] for index in indices]
         original_txts = [self.segments[index]["text"] for index in indices]
 
+        cached_emissions = [None] * len(indices)
+        cache_keys = [None] * len(indices)
+        if self.emission_cache is not None and self.load_audio:
+            audio_digest = file_digest(self.path_to_wav)
+            cache_keys = [
+                (audio_digest, offset, duration)
+                for offset, duration in zip(offsets, durations)
+            ]
+            cached_emissions = [
+                self.emission_cache.get(*cache_key) for cache_key in cache_keys
+            ]
+
         wav_arrays = [
-            torchaudio.backend.sox_io_backend.load(
-                self.path_to_wav,
-                int(offset * SR),
-                int(duration * SR),
-            )[0]
-            for offset, duration in zip(offsets, durations)
+            (
+                self.audio.segment(offset, duration)
+                if cached_emission is None and self.load_audio
+                else None
+            )
+            for offset, duration, cached_emission in zip(
+                offsets, durations, cached_emissions
+            )
         ]
 
         tokenized_cleaned_txts = [
-            text_cleaning.tokenize_text(
-                text_cleaning.clean_text(txt, self.lang), self.vocab, self.lang
-            )
-            for txt in original_txts
+            self.tokenized_cleaned_txts[index] for index in indices
         ]
+        token_ids = [self.token_ids[index] for index in indices]
 
-        return (wav_arrays, original_txts, tokenized_cleaned_txts, offsets, durations)
+        return (
+            wav_arrays,
+            original_txts,
+            tokenized_cleaned_txts,
+            offsets,
+            durations,
+            cached_emissions,
+            cache_keys,
+            token_ids,
+        )
 
     def my_collate_fn(self, batch: tuple) -> tuple:
-        """some necessary corrections to the format of the batch"""
-        batch = batch[0]
-        wav_arrays = [wav_array.numpy()[0] for wav_array in batch[0]]
-        return wav_arrays, batch[1], batch[2], batch[3], batch[4]
+        """some necessary corrections to the format of the batch (the samples
+        are kept as they are read, and converted by "BatchBuilder")"""
+        return batch[0]
 
 
 class DurationBatchSampler(Sampler):
@@ -142,6 +260,176 @@ class DurationBatchSampler(Sampler):
         return iter(batches)
 
 
+class BucketBatchSampler(Sampler):
+    def __init__(self, durations: list[float], max_seconds_batch: float):
+        """creates batches of similar length from the indices of a dataset,
+        so that the padded length of each batch (length of the longest
+        example x number of examples) is within max_seconds_batch
+
+        Args:
+            durations (list[float]): durations of the segments in the dataset
+            max_seconds_batch (float): maximum padded seconds within a batch
+        """
+        super().__init__(durations)
+        self.durations = durations
+        self.max_seconds_batch = max_seconds_batch
+
+    def __iter__(self):
+        # longest first, so the longest example of a batch is its first one
+        order = np.argsort(self.durations, kind="stable")[::-1].tolist()
+
+        batches = []
+        batch_max, batch = 0, []
+        for idx in order:
+            if batch and batch_max * (len(batch) + 1) > self.max_seconds_batch:
+                batches.append(batch)
+                batch = []
+            if not batch:
+                batch_max = self.durations[idx]
+            batch.append(idx)
+
+        if batch:
+            batches.append(batch)
+
+        return iter(batches)
+
+
+def format_plan_summary(counts: dict) -> str:
+    """summary of the examples (and audio) that do not need the model
+
+    Args:
+        counts (dict): the sum of "WavDataset.plan_counts" over the talks
+    """
+    return (
+        f"{counts['segments']} segments ({counts['empty']} with an empty text, "
+        f"{counts['infeasible']} with more tokens than frames, which fail): "
+        f"{counts['planned_seconds']:.0f}s out of {counts['seconds']:.0f}s of audio "
+        f"({counts['planned_seconds'] / max(counts['seconds'], 1e-9):.1%}) "
+        "without the model"
+    )
+
+
+# talks whose audio is kept open by each process that loads the batches of a
+# TalksDataset (the rest are closed, the least recently used first)
+MAX_OPEN_TALKS = 2
+
+
+class TalksDataset(Dataset):
+    def __init__(
+        self, talks: list[WavDataset], max_seconds_batch: float, batching: str = "talk"
+    ):
+        """the batches of the segments of several talks, so that they can be
+        prefetched by the workers of a DataLoader while the current batch is
+        being aligned
+
+        Args:
+            talks (list[WavDataset]): the dataset of each talk
+            max_seconds_batch (float): maximum seconds within a batch
+            batching (str, optional): "talk" for the batches of DurationBatchSampler
+                in each talk, one talk after the other, or "global" for the batches
+                of BucketBatchSampler over the segments of all the talks
+        """
+        super().__init__()
+
+        self.talks = talks
+        # only the examples that need the model (see WavDataset._plan_items)
+        if batching == "talk":
+            self.batches = [
+                [(talk_idx, talk.to_align[i]) for i in indices]
+                for talk_idx, talk in enumerate(talks)
+                for indices in DurationBatchSampler(
+                    [talk.segments[idx]["duration"] for idx in talk.to_align],
+                    max_seconds_batch,
+                )
+            ]
+        elif batching == "global":
+            items = [
+                (talk_idx, idx)
+                for talk_idx, talk in enumerate(talks)
+                for idx in talk.to_align
+            ]
+            self.batches = [
+                [items[i] for i in indices]
+                for indices in BucketBatchSampler(
+                    [self.duration(item) for item in items], max_seconds_batch
+                )
+            ]
+        else:
+            raise ValueError(f"Unknown batching: {batching}")
+        # the talks whose audio is open, from the least to the most recently used
+        # (each worker of a DataLoader has its own copy of the dataset)
+        self.open_talks = OrderedDict()
+
+    def __len__(self):
+        return len(self.batches)
+
+    def _use_audio(self, talk_idx: int):
+        """marks the audio of a talk as the most recently used, and closes the
+        audio of the talks beyond MAX_OPEN_TALKS"""
+        self.open_talks[talk_idx] = None
+        self.open_talks.move_to_end(talk_idx)
+        while len(self.open_talks) > MAX_OPEN_TALKS:
+            least_recent_idx, _ = self.open_talks.popitem(last=False)
+            self.talks[least_recent_idx].release_audio()
+
+    def duration(self, item: tuple[int, int]) -> float:
+        talk_idx, idx = item
+        return self.talks[talk_idx].segments[idx]["duration"]
+
+    def padding_ratio(self) -> float:
+        """fraction of the padded audio of the batches that is padding"""
+        total, padded = 0.0, 0.0
+        for batch in self.batches:
+            durations = [self.duration(item) for item in batch]
+            total += sum(durations)
+            padded += max(durations) * len(durations)
+        return 1 - total / padded if padded else 0.0
+
+    def plan_summary(self) -> str:
+        """the examples (and audio) that do not need the model"""
+        counts = Counter()
+        for talk in self.talks:
+            counts.update(talk.plan_counts())
+        return format_plan_summary(counts)
+
+    def __getitem__(self, batch_idx: int) -> tuple:
+        """returns the (talk index, segment index) of each example of a batch,
+        the collated batch of the ones that could be loaded, those that could
+        not be loaded, and the seconds it took to load the batch"""
+        start_time = time.perf_counter()
+
+        items, failed_items, talk_batches = [], [], []
+        batch = self.batches[batch_idx]
+        # examples of the same talk are consecutive (in any of the batchings)
+        for talk_idx in dict.fromkeys(talk_idx for talk_idx, _ in batch):
+            talk_items = [item for item in batch if item[0] == talk_idx]
+            talk = self.talks[talk_idx]
+            try:
+                talk_batches.append(
+                    talk.my_collate_fn([talk[[idx for _, idx in talk_items]]])
+                )
+                items.extend(talk_items)
+            except (RuntimeError, OSError):
+                failed_items.extend(talk_items)
+            if talk.load_audio:
+                self._use_audio(talk_idx)
+
+        # concatenate the fields of the batches of each talk
+        batch = (
+            tuple(
+                [x for talk_batch in talk_batches for x in talk_batch[field]]
+                for field in range(len(talk_batches[0]))
+            )
+            if talk_batches
+            else None
+        )
+
+        return items, batch, failed_items, time.perf_counter() - start_time
+
+    def my_collate_fn(self, batch: tuple) -> tuple:
+        return batch[0]
+
+
 def load_data(path_to_yaml: Path, path_to_txt: Path) -> dict:
     """loads and combines the original segmentation and text for a dataset
 
@@ -177,217 +465,1927 @@ def load_data(path_to_yaml: Path, path_to_txt: Path) -> dict:
     return segments_per_talk
 
 
-def get_word_segments_for_wav(
-    path_to_wav: Path,
-    segments: list[dict],
+# the padded input of the model, whose buffer is reused across the batches
+_BATCH_BUILDER = BatchBuilder()
+
+
+def get_emissions(
+    audios: list[np.ndarray],
     model: Wav2Vec2ForCTC,
     processor: Wav2Vec2Processor,
-    vocab: dict,
-    lang: str,
     device: torch.device,
-    max_seconds_example: float,
-    max_seconds_batch: float,
-) -> tuple[list[forced_alignment.Segment], list[dict]]:
-    """does forced-alignment with wav2vec2.0 for a wav file
+) -> tuple[torch.Tensor, list[int]]:
+    """runs wav2vec2.0 on a batch of audios
 
     Args:
-        path_to_wav (Path): path to wav file
-        segments (list[dict]): list of original segments
+        audios (list[np.ndarray]): the audio of each example (int16 or float samples)
         model (Wav2Vec2ForCTC): wav2vec2.0 model
         processor (Wav2Vec2Processor): wav2vec2.0 processor
-        vocab (dict): wav2vec2.0 vocabulary
         device (torch.device): cuda device
-        max_seconds_example (float): maximum length of an example
-        max_seconds_batch (float): maximum length of the examples in a batch
 
     Returns:
-        tuple[list[alignment.Segment], list[str]]: the output of the forced-alignment
-        and a list of failed segments (either long or failed)
+        tuple[torch.Tensor, list[int]]: the (padded) log-probabilities of the batch
+        on cpu, and the number of valid frames of each example
     """
+    feature_extractor = processor.feature_extractor
+    if (
+        feature_extractor.do_normalize
+        and feature_extractor.padding_value == 0.0
+        and feature_extractor.return_attention_mask
+    ):
+        # the same input as the processor, without its intermediate copies
+        input_values, attention_mask = _BATCH_BUILDER(audios)
+    else:
+        tokenized_audio = processor(
+            [to_float32(audio) for audio in audios],
+            return_tensors="pt",
+            padding="longest",
+            sampling_rate=SR,
+        )
+        input_values = tokenized_audio.input_values
+        attention_mask = tokenized_audio.attention_mask
 
-    dataset = WavDataset(path_to_wav, segments, vocab, lang, max_seconds_example)
-    batch_sampler = DurationBatchSampler(
-        [sgm["duration"] for sgm in dataset.segments], max_seconds_batch
-    )
-    dataloader = DataLoader(
-        dataset, sampler=batch_sampler, collate_fn=dataset.my_collate_fn, num_workers=0
+    logits = model(
+        input_values.to(device), attention_mask=attention_mask.to(device)
+    ).logits
+    emissions = torch.log_softmax(logits.float(), dim=-1).detach().cpu()
+
+    true_lens = (attention_mask.sum(dim=1) // N).clamp(max=emissions.size(1))
+    return emissions, true_lens.tolist()
+
+
+def is_out_of_memory(error: Exception) -> bool:
+    """checks if an error is due to running out of memory (on cpu or gpu)"""
+    return (
+        isinstance(error, MemoryError)
+        or "out of memory" in str(error)
+        or "can't allocate memory" in str(error)
     )
 
-    all_word_segments, failed_segments = [], []
-    with torch.no_grad():
-        for (
-            audios,
-            original_texts,
-            tokenized_cleaned_texts,
-            offsets,
-            durations,
-        ) in iter(dataloader):
-            tokenized_audio = processor(
-                audios,
-                return_tensors="pt",
-                padding="longest",
-                sampling_rate=SR,
+
+class FrameBudget:
+    def __init__(self):
+        """largest padded batch (frames of the longest example x number of
+        examples) that is known to fit in memory, which is learned during a run
+        from the batches that run out of memory"""
+        self.max_frames = None
+
+    def fits(self, num_frames: int) -> bool:
+        return self.max_frames is None or num_frames <= self.max_frames
+
+    def out_of_memory(self, num_frames: int):
+        """updates the budget after a batch of num_frames ran out of memory"""
+        if self.fits(num_frames):
+            self.max_frames = num_frames - 1
+            tqdm.write(
+                f"Out of memory with a batch of {num_frames} frames, "
+                f"splitting the batches above {self.max_frames} frames"
             )
-            input_values = tokenized_audio.input_values.to(device)
-            attention_mask = tokenized_audio.attention_mask.to(device)
-            logits = model(input_values, attention_mask=attention_mask).logits
-            emissions = torch.log_softmax(logits, dim=-1).detach().cpu()
-
-            for (
-                emission,
-                attn_mask,
-                original_txt,
-                tokenized_cleaned_txt,
-                offset,
-                duration,
-            ) in zip(
-                emissions,
-                attention_mask,
-                original_texts,
-                tokenized_cleaned_texts,
-                offsets,
-                durations,
-            ):
-                # mapping for clean (ASR-like) to original text tokens
-                clean2original = forced_alignment.get_monolingual_alignments(
-                    original_txt.split(), tokenized_cleaned_txt.split("|"), lang
-                )
 
-                if tokenized_cleaned_txt == "":
-                    # only one option
-                    all_word_segments.append(
-                        forced_alignment.Segment(
-                            "", offset, offset + duration, -1.0, clean2original[0]
-                        )
-                    )
-                    continue
 
-                true_len = int(attn_mask.sum().item() / N)
-                emission = emission[:true_len]
+def get_emissions_adaptive(
+    audios: list[np.ndarray],
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    device: torch.device,
+    frame_budget: FrameBudget = None,
+) -> list[torch.Tensor]:
+    """runs wav2vec2.0 on a batch of audios, splitting it in halves when it does
+    not fit in the frame budget or when it runs out of memory
 
-                tokens = [vocab[c] for c in tokenized_cleaned_txt]
+    Args:
+        frame_budget (FrameBudget, optional): if not given, running out of memory
+            raises an error as usual
+        (rest as in "get_emissions")
 
-                # find path
-                trellis = forced_alignment.get_trellis(emission, tokens)
-                path = forced_alignment.backtrack(trellis, emission, tokens)
+    Returns:
+        list[torch.Tensor]: the (unpadded) emission of each example, or None
+        for the single examples that do not fit in memory
+    """
+    if not audios:
+        return []
 
-                if not path:
-                    failed_segments.append(
-                        {
-                            "start": offset,
-                            "end": offset + duration,
-                            "flag": "failed",
-                            "text": original_txt,
-                        }
-                    )
-                    continue
+    def split_in_halves() -> list[torch.Tensor]:
+        half = len(audios) // 2
+        return get_emissions_adaptive(
+            audios[:half], model, processor, device, frame_budget
+        ) + get_emissions_adaptive(
+            audios[half:], model, processor, device, frame_budget
+        )
 
-                char_segments = forced_alignment.merge_repeats(
-                    path, tokenized_cleaned_txt
-                )
-                word_segments = forced_alignment.merge_words(char_segments, offset)
+    num_frames = max(len(audio) for audio in audios) // N * len(audios)
+    if (
+        len(audios) > 1
+        and frame_budget is not None
+        and not frame_budget.fits(num_frames)
+    ):
+        return split_in_halves()
 
-                # add corresponding original text
-                for i, original_txt in clean2original.items():
-                    word_segments[i].original_label = original_txt
+    try:
+        emissions, true_lens = get_emissions(audios, model, processor, device)
+    except (RuntimeError, MemoryError) as error:
+        if frame_budget is None or not is_out_of_memory(error):
+            raise
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+        frame_budget.out_of_memory(num_frames)
+        if len(audios) == 1:
+            return [None]
+        return split_in_halves()
 
-                # merge segments with the same original text
-                word_segments = forced_alignment.merge_original(word_segments)
+    return [emission[:true_len] for emission, true_len in zip(emissions, true_lens)]
 
-                all_word_segments.append(word_segments)
 
-    # type correction
-    all_word_segments = [
-        word_segments if type(word_segments) == list else [word_segments]
-        for word_segments in all_word_segments
-    ]
-    # flatten
-    all_word_segments = [
-        word_sgm for word_segments in all_word_segments for word_sgm in word_segments
+def get_emissions_with_cache(
+    audios: list[np.ndarray],
+    cached_emissions: list[np.ndarray],
+    cache_keys: list[tuple],
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    device: torch.device,
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+) -> list[torch.Tensor]:
+    """gets the emissions of a batch from the cache, and runs wav2vec2.0
+    only on the examples that are not cached (storing their emissions)
+
+    Args:
+        audios (list[np.ndarray]): the audio of each example (None if cached)
+        cached_emissions (list[np.ndarray]): the cached emission of each example
+            (None if not cached)
+        cache_keys (list[tuple]): (audio digest, offset, duration) of each example
+        emission_cache (EmissionCache, optional): the cache of the emissions
+        frame_budget (FrameBudget, optional): as in "get_emissions_adaptive"
+        (rest as in "get_emissions")
+
+    Returns:
+        list[torch.Tensor]: the (unpadded) emission of each example
+        (None if it does not fit in memory)
+    """
+    emissions = [
+        torch.from_numpy(emission.astype(np.float32)) if emission is not None else None
+        for emission in cached_emissions
     ]
-    # fix order
-    indices = np.argsort([word_sgm.start for word_sgm in all_word_segments])
-    all_word_segments = [all_word_segments[idx] for idx in indices]
-    # combine failed
-    failed_segments = dataset.long_segments + failed_segments
 
-    return all_word_segments, failed_segments
+    to_compute = [i for i, emission in enumerate(emissions) if emission is None]
+    if to_compute:
+        computed_emissions = get_emissions_adaptive(
+            [audios[i] for i in to_compute], model, processor, device, frame_budget
+        )
+        for i, emission in zip(to_compute, computed_emissions):
+            if emission_cache is not None and emission is not None:
+                emission = emission_cache.put(*cache_keys[i], emission)
+            emissions[i] = emission
 
+    return emissions
 
-def get_word_segments(args):
-    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
 
-    wav2vec_model_name = WAV2VEC_MODEL_NAME[args.language_code]
-    model = Wav2Vec2ForCTC.from_pretrained(wav2vec_model_name).eval().to(device)
-    tokenizer = Wav2Vec2CTCTokenizer.from_pretrained(wav2vec_model_name)
-    feature_extractor = Wav2Vec2FeatureExtractor(
-        feature_size=1,
-        sampling_rate=SR,
-        padding_value=0.0,
-        do_normalize=True,
-        return_attention_mask=True,
+def get_paths(
+    emissions: list[torch.Tensor],
+    tokens: list[list[int]],
+    trellis_backend: str = "torch",
+    blank_threshold: float = None,
+) -> list[forced_alignment.PointArray]:
+    """finds the forced-alignment paths of a batch of examples at once
+
+    Args:
+        emissions (list[torch.Tensor]): the (unpadded) emission of each example
+        tokens (list[list[int]]): token ids of each example
+        trellis_backend (str, optional): backend for the batched trellis computation
+        blank_threshold (float, optional): if given, runs of frames with a blank
+            probability above it are collapsed before computing the trellis
+
+    Returns:
+        list[forced_alignment.PointArray]: the path of each example
+        (empty if the alignment failed)
+    """
+    if not emissions:
+        return []
+
+    frame_bounds = [None] * len(emissions)
+    trellis_emissions = emissions
+    if blank_threshold is not None:
+        trellis_emissions, frame_bounds = zip(
+            *[
+                forced_alignment.compress_blank_frames(emission, blank_threshold)
+                for emission in emissions
+            ]
+        )
+
+    trellises, backpointers = forced_alignment.get_trellis_batch(
+        pad_sequence(trellis_emissions, batch_first=True),
+        tokens,
+        [emission.size(0) for emission in trellis_emissions],
+        backend=trellis_backend,
+        return_backpointers=True,
     )
-    processor = Wav2Vec2Processor(feature_extractor, tokenizer)
 
-    wav_dir = Path(args.path_to_wav)
-    out_dir = Path(args.path_to_output_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(len(emissions)):
+        path = forced_alignment.backtrack(
+            trellises[i], trellis_emissions[i], tokens[i], backpointers=backpointers[i]
+        )
+        if frame_bounds[i] is not None:
+            if path:
+                path = forced_alignment.expand_path(
+                    path, emissions[i], tokens[i], frame_bounds[i]
+                )
+            else:
+                # too few frames after the compression, try without it
+                path = get_paths([emissions[i]], [tokens[i]], trellis_backend)[0]
+        paths.append(path)
+    return paths
 
-    segments_per_talk = load_data(args.path_to_yaml, args.path_to_txt)
 
-    print("Iterating through talks ...")
-    for talk_id, talk_segments in tqdm(segments_per_talk.items()):
-        out_file = out_dir / f"{talk_id}.json"
+def get_paths_adaptive(
+    emissions: list[torch.Tensor],
+    tokens: list[list[int]],
+    trellis_backend: str = "torch",
+    blank_threshold: float = None,
+) -> list[forced_alignment.PointArray]:
+    """as "get_paths", but a batch that runs out of memory is split in halves,
+    and the alignment of a single example that does not fit in memory fails"""
+    try:
+        return get_paths(emissions, tokens, trellis_backend, blank_threshold)
+    except (RuntimeError, MemoryError) as error:
+        if not is_out_of_memory(error):
+            raise
+        if len(emissions) == 1:
+            return [forced_alignment.PointArray.empty()]
+        half = len(emissions) // 2
+        return get_paths_adaptive(
+            emissions[:half], tokens[:half], trellis_backend, blank_threshold
+        ) + get_paths_adaptive(
+            emissions[half:], tokens[half:], trellis_backend, blank_threshold
+        )
 
-        if not out_file.exists() or args.override_files:
-            wav_file = wav_dir / f"{talk_id}.wav"
 
-            try:
-                word_segments, failed_segments = get_word_segments_for_wav(
-                    wav_file,
-                    talk_segments,
+def get_word_segments_for_empty_text(
+    original_txt: str, offset: float, duration: float, lang: str
+) -> forced_alignment.SegmentArray:
+    """the only option for a segment whose tokenized text is empty: a single word
+    segment for the whole segment with the original text"""
+    clean2original = forced_alignment.get_monolingual_alignments(
+        original_txt.split(), [""], lang
+    )
+    return forced_alignment.SegmentArray.from_lists(
+        [offset], [offset + duration], [-1.0], [""], [clean2original[0]]
+    )
+
+
+def get_word_segments_for_path(
+    path: forced_alignment.PointArray,
+    tokenized_cleaned_txt: str,
+    clean2original: dict[int, str],
+    offset: float,
+) -> forced_alignment.SegmentArray:
+    """converts the path of the forced-alignment of a segment to word segments
+
+    Args:
+        path (forced_alignment.PointArray): output of the backtracking
+        tokenized_cleaned_txt (str): tokenized text of the segment
+        clean2original (dict[int, str]): mapping from clean to original text tokens
+        offset (float): start of the segment in the wav file
+
+    Returns:
+        forced_alignment.SegmentArray: the word segments
+    """
+    char_segments = forced_alignment.merge_repeats(path, tokenized_cleaned_txt)
+    word_segments = forced_alignment.merge_words(char_segments, offset)
+
+    # add corresponding original text
+    word_segments = word_segments.with_original_labels(clean2original)
+
+    # merge segments with the same original text
+    return forced_alignment.merge_original(word_segments)
+
+
+# audio to each side of the windows of "get_windowed_emission", whose frames are
+# discarded, so that the kept frames have (almost) the same context as in a
+# single pass over the whole audio
+WINDOW_CONTEXT_SECONDS = 2.0
+
+
+def get_windowed_emission(
+    samples: np.ndarray,
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    device: torch.device,
+    window_seconds: float,
+    max_seconds_batch: float,
+    frame_budget: FrameBudget = None,
+) -> torch.Tensor:
+    """computes the emission of some audio in overlapping windows of constant
+    length, which are stitched into a single emission
+
+    Args:
+        samples (np.ndarray): the audio
+        window_seconds (float): length of the windows (without their context)
+        max_seconds_batch (float): maximum length of the windows in a batch
+            (with their context)
+        frame_budget (FrameBudget, optional): as in "get_emissions_adaptive"
+
+    Returns:
+        torch.Tensor: the emission of the audio, with frame i starting at
+        sample i * N (None if a window does not fit in memory)
+    """
+    num_frames = max(0, (len(samples) - 400) // N + 1)
+
+    # the windows start at multiples of the stride, so that their frames are
+    # on the same grid, and with the 80 extra samples of the receptive field
+    # they have exactly as many frames as (end - start)
+    window_frames = int(window_seconds * SR / N)
+    context_frames = int(WINDOW_CONTEXT_SECONDS * SR / N)
+    windows, kept_frames = [], []
+    for start in range(0, num_frames, window_frames):
+        end = min(start + window_frames, num_frames)
+        left = min(context_frames, start)
+        right = min(context_frames, num_frames - end)
+        windows.append(samples[(start - left) * N : (end + right) * N + 80])
+        kept_frames.append(slice(left, left + end - start))
+    if not windows:
+        return None
+    windows_per_batch = max(
+        1, int(max_seconds_batch // (window_seconds + 2 * WINDOW_CONTEXT_SECONDS))
+    )
+
+    emission = []
+    with torch.no_grad():
+        for i in range(0, len(windows), windows_per_batch):
+            emission.extend(
+                get_emissions_adaptive(
+                    windows[i : i + windows_per_batch],
                     model,
                     processor,
-                    tokenizer.encoder,
-                    args.language_code,
                     device,
-                    args.max_seconds_example,
-                    args.max_seconds_batch,
+                    frame_budget,
                 )
-            except RuntimeError:
-                print(f"Failed forced-alignment, skipping file: {wav_file}")
-                continue
+            )
+    if any(em is None for em in emission):
+        return None
+    return torch.cat([em[kept] for em, kept in zip(emission, kept_frames)])
 
-            word_segments = [
-                {
-                    "start": round(w_sgm.start, 2),
-                    "end": round(w_sgm.end, 2),
-                    "word": w_sgm.label,
-                    "text": w_sgm.original_label,
-                }
-                for w_sgm in word_segments
-            ]
 
-            with open(out_file, "w") as f:
-                json.dump(
-                    {
-                        "word_segments": word_segments,
-                        "failed_segments": failed_segments,
-                    },
-                    f,
-                )
+def long_emission_window_seconds(max_seconds_example: float) -> float:
+    """length of the windows of "get_long_emission", so that with their
+    context they are not longer than max_seconds_example"""
+    return max(max_seconds_example - 2 * WINDOW_CONTEXT_SECONDS, WINDOW_CONTEXT_SECONDS)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--language-code", "-lang", type=str, required=True)
-    parser.add_argument("--path-to-wav", "-wav", type=str, required=True)
-    parser.add_argument("--path-to-txt", "-txt", type=str, required=True)
-    parser.add_argument("--path-to-yaml", "-yaml", type=str, required=True)
-    parser.add_argument("--path-to-output-dir", "-out", type=str, required=True)
-    parser.add_argument("--max-seconds-example", "-max1", type=float, default=60)
-    parser.add_argument("--max-seconds-batch", "-max2", type=float, default=60)
-    parser.add_argument("--override-files", "-ovr", action="store_true")
-    args = parser.parse_args()
+def get_long_emission(
+    path_to_wav: Path,
+    offset: float,
+    duration: float,
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    device: torch.device,
+    max_seconds_example: float,
+    max_seconds_batch: float,
+    frame_budget: FrameBudget = None,
+) -> torch.Tensor:
+    """computes the emission of a segment longer than max_seconds_example in
+    overlapping windows (as in "get_talk_emission", within the segment)
+
+    Returns:
+        torch.Tensor: the emission of the whole segment
+        (None if a window does not fit in memory)
+    """
+    return get_windowed_emission(
+        TalkAudio(path_to_wav).segment(offset, duration),
+        model,
+        processor,
+        device,
+        long_emission_window_seconds(max_seconds_example),
+        max_seconds_batch,
+        frame_budget,
+    )
+
+
+def get_talk_emission(
+    path_to_wav: Path,
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    device: torch.device,
+    window_seconds: float,
+    max_seconds_batch: float,
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+) -> torch.Tensor:
+    """computes the emission of a whole wav file in overlapping windows of
+    constant length, which are stitched into a single emission
+
+    Args:
+        path_to_wav (Path): path to wav file
+        window_seconds (float): length of the windows (without their context)
+        max_seconds_batch (float): maximum length of the windows in a batch
+            (with their context)
+        emission_cache (EmissionCache, optional): the cache of the emissions
+        frame_budget (FrameBudget, optional): as in "get_emissions_adaptive"
+
+    Returns:
+        torch.Tensor: the emission of the wav file, with frame i starting at
+        sample i * N (None if a window does not fit in memory)
+    """
+    if emission_cache is not None:
+        cache_key = (file_digest(path_to_wav), 0.0, None)
+        emission = emission_cache.get(*cache_key, chunk_seconds=window_seconds)
+        if emission is not None:
+            return torch.from_numpy(emission.astype(np.float32))
+
+    emission = get_windowed_emission(
+        TalkAudio(path_to_wav).samples[:, 0],
+        model,
+        processor,
+        device,
+        window_seconds,
+        max_seconds_batch,
+        frame_budget,
+    )
+
+    if emission is not None and emission_cache is not None:
+        emission = emission_cache.put(
+            *cache_key, emission, chunk_seconds=window_seconds
+        )
+    return emission
+
+
+def slice_talk_emission(
+    talk_emission: torch.Tensor, offset: float, duration: float
+) -> tuple[torch.Tensor, float]:
+    """the frames of the emission of a wav file (from "get_talk_emission")
+    that are within a segment
+
+    Args:
+        talk_emission (torch.Tensor): the emission of the wav file
+        offset (float): start of the segment in the wav file
+        duration (float): duration of the segment
+
+    Returns:
+        tuple[torch.Tensor, float]: the emission of the segment (a view, None if
+        there is no talk emission), and the start of its first frame in seconds
+    """
+    start, end = int(offset * SR), int(offset * SR) + int(duration * SR)
+    first = round(start / N)
+    if talk_emission is None:
+        return None, first * N / SR
+    last = min((end - 400) // N + 1, talk_emission.size(0))
+    return talk_emission[first : max(first, last)], first * N / SR
+
+
+def get_word_segments_for_long_segment(
+    path_to_wav: Path,
+    long_segment: dict,
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    vocab: dict,
+    lang: str,
+    device: torch.device,
+    max_seconds_example: float,
+    max_seconds_batch: float,
+    band_width: int,
+    max_trellis_mb: float,
+    trellis_backend: str = "torch",
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+    talk_emission: torch.Tensor = None,
+    text_aligner: str = "dp",
+) -> forced_alignment.SegmentArray:
+    """does memory-bounded forced-alignment for a segment that is longer than
+    max_seconds_example, by computing its emissions in chunks and aligning
+    them with a banded trellis
+
+    Args:
+        path_to_wav (Path): path to wav file
+        long_segment (dict): the long segment (as in WavDataset.long_segments)
+        band_width (int): number of tokens to each side of the diagonal of the trellis
+        max_trellis_mb (float): memory budget for the trellis in MB
+        talk_emission (torch.Tensor, optional): the emission of the whole wav file
+            (from "get_talk_emission"), which is sliced instead of computing
+            the emission of the segment
+        (rest as in "get_word_segments_for_wav")
+
+    Returns:
+        forced_alignment.SegmentArray: the word segments, or None if the alignment failed
+    """
+    offset = long_segment["start"]
+    duration = long_segment["end"] - long_segment["start"]
+    original_txt = long_segment["text"]
+
+    text_tokenizer = text_cleaning.TextTokenizer.for_vocab(vocab, lang)
+    tokenized_cleaned_txt = text_tokenizer.tokenize(
+        text_cleaning.clean_text(original_txt, lang)
+    )
+    if tokenized_cleaned_txt == "":
+        return get_word_segments_for_empty_text(original_txt, offset, duration, lang)
+    clean2original = forced_alignment.TEXT_ALIGNERS[text_aligner](
+        original_txt.split(), tokenized_cleaned_txt.split("|"), lang
+    )
+
+    if talk_emission is not None:
+        emission, offset = slice_talk_emission(talk_emission, offset, duration)
+    else:
+        emission = None
+        if emission_cache is not None:
+            cache_key = (file_digest(path_to_wav), offset, duration)
+            emission = emission_cache.get(
+                *cache_key,
+                chunk_seconds=long_emission_window_seconds(max_seconds_example),
+            )
+        if emission is not None:
+            emission = torch.from_numpy(emission.astype(np.float32))
+        else:
+            emission = get_long_emission(
+                path_to_wav,
+                offset,
+                duration,
+                model,
+                processor,
+                device,
+                max_seconds_example,
+                max_seconds_batch,
+                frame_budget,
+            )
+            if emission is None:
+                return None
+            if emission_cache is not None:
+                emission = emission_cache.put(
+                    *cache_key,
+                    emission,
+                    chunk_seconds=long_emission_window_seconds(max_seconds_example),
+                )
+
+    tokens = text_tokenizer.encode(tokenized_cleaned_txt)
+    path = forced_alignment.align_long(
+        emission, tokens, band_width, max_trellis_mb, backend=trellis_backend
+    )
+    if not path:
+        return None
+
+    return get_word_segments_for_path(
+        path, tokenized_cleaned_txt, clean2original, offset
+    )
+
+
+def align_batch(
+    batch: tuple,
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    vocab: dict,
+    lang: str,
+    device: torch.device,
+    trellis_backend: str = "torch",
+    blank_threshold: float = None,
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+    text_aligner: str = "dp",
+) -> list:
+    """does forced-alignment for a batch of segments
+
+    Args:
+        batch (tuple): a batch of WavDataset (after "my_collate_fn")
+        (rest as in "get_word_segments_for_wav")
+
+    Returns:
+        list: for each example, its word segments (forced_alignment.SegmentArray),
+        or a dict with the failed segment
+    """
+    (
+        audios,
+        original_texts,
+        tokenized_cleaned_texts,
+        offsets,
+        durations,
+        cached_emissions,
+        cache_keys,
+        token_ids,
+    ) = batch
+
+    emissions = get_emissions_with_cache(
+        audios,
+        cached_emissions,
+        cache_keys,
+        model,
+        processor,
+        device,
+        emission_cache,
+        frame_budget,
+    )
+    return align_emissions(
+        emissions,
+        original_texts,
+        tokenized_cleaned_texts,
+        offsets,
+        durations,
+        vocab,
+        lang,
+        trellis_backend,
+        blank_threshold,
+        token_ids=token_ids,
+        text_aligner=text_aligner,
+    )
+
+
+def align_emissions(
+    emissions: list[torch.Tensor],
+    original_texts: list[str],
+    tokenized_cleaned_texts: list[str],
+    offsets: list[float],
+    durations: list[float],
+    vocab: dict,
+    lang: str,
+    trellis_backend: str = "torch",
+    blank_threshold: float = None,
+    emission_offsets: list[float] = None,
+    token_ids: list[np.ndarray] = None,
+    text_aligner: str = "dp",
+) -> list:
+    """does the forced-alignment of a batch of segments from their emissions
+    (everything that comes after the model)
+
+    Args:
+        emissions (list[torch.Tensor]): the (unpadded) emission of each example
+            (None for the examples that did not fit in memory, which fail)
+        original_texts (list[str]): original text of each example
+        tokenized_cleaned_texts (list[str]): tokenized text of each example
+        offsets (list[float]): start of each example in the wav file
+        durations (list[float]): duration of each example
+        emission_offsets (list[float], optional): start of the first frame of each
+            emission in the wav file, if it is not the offset of the example
+            (for emissions sliced from the one of the talk)
+        token_ids (list[np.ndarray], optional): token ids of each example
+            (from the tokenized texts, if not given)
+        (rest as in "get_word_segments_for_wav")
+
+    Returns:
+        list: as in "align_batch"
+    """
+    tokens = token_ids
+    if tokens is None:
+        text_tokenizer = text_cleaning.TextTokenizer.for_vocab(vocab, lang)
+        tokens = [text_tokenizer.encode(txt) for txt in tokenized_cleaned_texts]
+
+    # paths of all the non-empty examples of the batch at once
+    to_align = [
+        i
+        for i, txt in enumerate(tokenized_cleaned_texts)
+        if txt and emissions[i] is not None
+    ]
+    paths = get_paths_adaptive(
+        [emissions[i] for i in to_align],
+        [tokens[i] for i in to_align],
+        trellis_backend,
+        blank_threshold,
+    )
+    paths = dict(zip(to_align, paths))
+    if emission_offsets is None:
+        emission_offsets = offsets
+
+    results = []
+    for i, (original_txt, tokenized_cleaned_txt, offset, duration) in enumerate(
+        zip(original_texts, tokenized_cleaned_texts, offsets, durations)
+    ):
+        if tokenized_cleaned_txt == "":
+            # only one option
+            results.append(
+                get_word_segments_for_empty_text(original_txt, offset, duration, lang)
+            )
+            continue
+
+        # mapping for clean (ASR-like) to original text tokens
+        clean2original = forced_alignment.TEXT_ALIGNERS[text_aligner](
+            original_txt.split(), tokenized_cleaned_txt.split("|"), lang
+        )
+
+        path = paths.get(i)
+        if not path:
+            results.append(
+                {
+                    "start": offset,
+                    "end": offset + duration,
+                    "flag": "failed",
+                    "text": original_txt,
+                }
+            )
+            continue
+
+        results.append(
+            get_word_segments_for_path(
+                path, tokenized_cleaned_txt, clean2original, emission_offsets[i]
+            )
+        )
+
+    return results
+
+
+def share_emissions(emissions: list[torch.Tensor]) -> SharedMemory:
+    """copies the emissions of a batch into a new block of shared memory,
+    one after the other (the caller has to unlink it)"""
+    emissions = [emission for emission in emissions if emission is not None]
+    num_frames = sum(emission.size(0) for emission in emissions)
+    vocab_size = emissions[0].size(1) if emissions else 0
+    shm = SharedMemory(create=True, size=max(1, num_frames * vocab_size * 4))
+    if num_frames:
+        buffer = np.ndarray((num_frames, vocab_size), dtype=np.float32, buffer=shm.buf)
+        torch.cat(emissions, out=torch.from_numpy(buffer))
+        del buffer
+    return shm
+
+
+def align_shared_emissions(
+    shm_name: str, num_frames: list[int], vocab_size: int, *args, **kwargs
+) -> list:
+    """does "align_emissions" on the emissions of a batch in shared memory
+
+    Args:
+        shm_name (str): name of the block of shared memory (from "share_emissions")
+        num_frames (list[int]): number of frames of each example
+            (None for the examples without emission)
+        vocab_size (int): size of the vocabulary of the model
+        (rest as in "align_emissions")
+    """
+    shared_frames = [n for n in num_frames if n is not None]
+    shm = SharedMemory(name=shm_name)
+    try:
+        # a (cheap) local copy, so that the block can be closed right away
+        emissions = torch.from_numpy(
+            np.ndarray(
+                (sum(shared_frames), vocab_size), dtype=np.float32, buffer=shm.buf
+            ).copy()
+        )
+    finally:
+        shm.close()
+    emissions = iter(emissions.split(shared_frames))
+    emissions = [next(emissions) if n is not None else None for n in num_frames]
+    return align_emissions(emissions, *args, **kwargs)
+
+
+def init_align_worker():
+    """the workers of the alignment pool use one thread each"""
+    torch.set_num_threads(1)
+
+
+def align_long_segments(
+    path_to_wav: Path,
+    long_segments: list[dict],
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    vocab: dict,
+    lang: str,
+    device: torch.device,
+    max_seconds_example: float,
+    max_seconds_batch: float,
+    band_width: int = 0,
+    max_trellis_mb: float = 2048,
+    trellis_backend: str = "torch",
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+    talk_emission: torch.Tensor = None,
+    text_aligner: str = "dp",
+) -> tuple[list[forced_alignment.SegmentArray], list[dict]]:
+    """tries to recover the long segments of a wav file with a memory-bounded
+    alignment (only if band_width is positive)
+
+    Args:
+        long_segments (list[dict]): the long segments (as in WavDataset.long_segments)
+        talk_emission (torch.Tensor, optional): as in
+            "get_word_segments_for_long_segment"
+        (rest as in "get_word_segments_for_wav")
+
+    Returns:
+        tuple[list[forced_alignment.SegmentArray], list[dict]]: the word segments
+        of each recovered segment and the long segments that were not recovered
+    """
+    if band_width <= 0:
+        return [], long_segments
+
+    all_word_segments, failed_segments = [], []
+    for long_segment in long_segments:
+        word_segments = get_word_segments_for_long_segment(
+            path_to_wav,
+            long_segment,
+            model,
+            processor,
+            vocab,
+            lang,
+            device,
+            max_seconds_example,
+            max_seconds_batch,
+            band_width,
+            max_trellis_mb,
+            trellis_backend,
+            emission_cache,
+            frame_budget,
+            talk_emission,
+            text_aligner,
+        )
+        if word_segments is None:
+            failed_segments.append(long_segment)
+        else:
+            all_word_segments.append(word_segments)
+    return all_word_segments, failed_segments
+
+
+def split_results(
+    results: list,
+    all_word_segments: list[forced_alignment.SegmentArray],
+    failed_segments: list[dict],
+) -> tuple[list[forced_alignment.SegmentArray], list[dict]]:
+    """adds the results of "align_batch" to the word segments or the failed segments"""
+    for result in results:
+        if isinstance(result, forced_alignment.SegmentArray):
+            all_word_segments.append(result)
+        else:
+            failed_segments.append(result)
+    return all_word_segments, failed_segments
+
+
+def combine_segments(
+    all_word_segments: list[forced_alignment.SegmentArray],
+    long_segments: list[dict],
+    failed_segments: list[dict],
+) -> tuple[forced_alignment.SegmentArray, list[dict]]:
+    """combines the outputs of the forced-alignment of a wav file"""
+    all_word_segments = forced_alignment.SegmentArray.concatenate(all_word_segments)
+    # fix order
+    all_word_segments = all_word_segments.take(np.argsort(all_word_segments.start))
+    # combine failed
+    failed_segments = long_segments + failed_segments
+
+    return all_word_segments, failed_segments
+
+
+def get_word_segments_for_wav(
+    path_to_wav: Path,
+    segments: list[dict],
+    model: Wav2Vec2ForCTC,
+    processor: Wav2Vec2Processor,
+    vocab: dict,
+    lang: str,
+    device: torch.device,
+    max_seconds_example: float,
+    max_seconds_batch: float,
+    trellis_backend: str = "torch",
+    band_width: int = 0,
+    max_trellis_mb: float = 2048,
+    blank_threshold: float = None,
+    emission_cache: EmissionCache = None,
+    frame_budget: FrameBudget = None,
+    text_aligner: str = "dp",
+    cleaned_texts: dict[str, str] = None,
+    plan_counts: Counter = None,
+) -> tuple[forced_alignment.SegmentArray, list[dict]]:
+    """does forced-alignment with wav2vec2.0 for a wav file
+
+    Args:
+        path_to_wav (Path): path to wav file
+        segments (list[dict]): list of original segments
+        model (Wav2Vec2ForCTC): wav2vec2.0 model
+        processor (Wav2Vec2Processor): wav2vec2.0 processor
+        vocab (dict): wav2vec2.0 vocabulary
+        device (torch.device): cuda device
+        max_seconds_example (float): maximum length of an example
+        max_seconds_batch (float): maximum length of the examples in a batch
+        trellis_backend (str, optional): backend for the batched trellis computation
+        band_width (int, optional): if positive, long segments are aligned with
+            a banded trellis of this width instead of being skipped
+        max_trellis_mb (float, optional): memory budget for aligning long segments
+        blank_threshold (float, optional): if given, runs of frames with a blank
+            probability above it are collapsed before computing the trellis
+        emission_cache (EmissionCache, optional): cache for the emissions of wav2vec2.0,
+            the model is only run for the segments that are not in the cache
+        frame_budget (FrameBudget, optional): if given, the batches that run out of
+            memory are split in halves (and single segments that do not fit fail),
+            instead of raising an error
+        text_aligner (str, optional): one of forced_alignment.TEXT_ALIGNERS, for
+            mapping the tokens of the clean text to the ones of the original text
+        cleaned_texts (dict[str, str], optional): as in WavDataset
+        plan_counts (Counter, optional): if given, the counts of the examples that
+            do not need the model are added to it (see "WavDataset.plan_counts")
+
+    Returns:
+        tuple[alignment.SegmentArray, list[str]]: the output of the forced-alignment
+        and a list of failed segments (either long or failed)
+    """
+
+    dataset = WavDataset(
+        path_to_wav,
+        segments,
+        vocab,
+        lang,
+        max_seconds_example,
+        emission_cache,
+        cleaned_texts=cleaned_texts,
+    )
+    if plan_counts is not None:
+        plan_counts.update(dataset.plan_counts())
+    # only the examples that need the model (see WavDataset._plan_items)
+    batches = [
+        [dataset.to_align[i] for i in indices]
+        for indices in DurationBatchSampler(
+            [dataset.segments[idx]["duration"] for idx in dataset.to_align],
+            max_seconds_batch,
+        )
+    ]
+    dataloader = DataLoader(
+        dataset, sampler=batches, collate_fn=dataset.my_collate_fn, num_workers=0
+    )
+
+    # results by example index, to keep the order of the examples
+    results = dict(dataset.planned_results)
+    with torch.no_grad():
+        for indices, batch in zip(batches, dataloader):
+            batch_results = align_batch(
+                batch,
+                model,
+                processor,
+                vocab,
+                lang,
+                device,
+                trellis_backend,
+                blank_threshold,
+                emission_cache,
+                frame_budget,
+                text_aligner,
+            )
+            results.update(zip(indices, batch_results))
+    all_word_segments, failed_segments = split_results(
+        [results[idx] for idx in sorted(results)], [], []
+    )
+
+    word_segments, long_segments = align_long_segments(
+        path_to_wav,
+        dataset.long_segments,
+        model,
+        processor,
+        vocab,
+        lang,
+        device,
+        max_seconds_example,
+        max_seconds_batch,
+        band_width,
+        max_trellis_mb,
+        trellis_backend,
+        emission_cache,
+        frame_budget,
+        text_aligner=text_aligner,
+    )
+    all_word_segments.extend(word_segments)
+
+    return combine_segments(all_word_segments, long_segments, failed_segments)
+
+
+PRECISIONS = ["fp32", "bf16", "int8"]
+
+
+class AutocastModel(torch.nn.Module):
+    def __init__(self, model: Wav2Vec2ForCTC, device: torch.device):
+        """runs a model with bfloat16 autocast
+
+        Args:
+            model (Wav2Vec2ForCTC): wav2vec2.0 model
+            device (torch.device): device of the model
+        """
+        super().__init__()
+        self.model = model
+        self.device_type = device.type
+
+    def forward(self, *args, **kwargs):
+        with torch.autocast(self.device_type, dtype=torch.bfloat16):
+            return self.model(*args, **kwargs)
+
+
+def load_pretrained_model(
+    model_name: str, device: torch.device, precision: str = "fp32"
+) -> torch.nn.Module:
+    """loads a pretrained wav2vec2.0 model for inference
+
+    Args:
+        model_name (str): name of the pretrained model
+        device (torch.device): cuda device
+        precision (str, optional): "fp32", "bf16" (autocast) or "int8" (dynamic
+            quantization of the linear layers, only on cpu)
+
+    Returns:
+        torch.nn.Module: the model
+    """
+    model = Wav2Vec2ForCTC.from_pretrained(model_name).eval().to(device)
+    if precision == "bf16":
+        model = AutocastModel(model, device)
+    elif precision == "int8":
+        if device.type != "cpu":
+            raise ValueError("int8 precision is only supported on cpu")
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif precision != "fp32":
+        raise ValueError(f"Unknown precision: {precision}")
+    return model
+
+
+class LazyModel:
+    def __init__(self, model_name: str, device: torch.device, precision: str = "fp32"):
+        """wav2vec2.0 model that is only loaded the first time it is called
+        (never, if all the emissions are in the cache)
+
+        Args:
+            model_name (str): name of the pretrained model
+            device (torch.device): cuda device
+            precision (str, optional): as in "load_pretrained_model"
+        """
+        self.model_name = model_name
+        self.device = device
+        self.precision = precision
+        self.model = None
+
+    def __call__(self, *args, **kwargs):
+        if self.model is None:
+            self.model = load_pretrained_model(
+                self.model_name, self.device, self.precision
+            )
+        return self.model(*args, **kwargs)
+
+
+def load_model(
+    language_code: str,
+    device: torch.device,
+    lazy: bool = False,
+    precision: str = "fp32",
+    backend: str = "torch",
+    onnx_dir: Path = DEFAULT_ONNX_DIR,
+    intra_op_threads: int = None,
+    inter_op_threads: int = None,
+) -> tuple[Wav2Vec2ForCTC, Wav2Vec2CTCTokenizer, Wav2Vec2Processor]:
+    """loads the wav2vec2.0 model, tokenizer and processor of a language
+    (if lazy, the model is loaded only when it is first needed).
+    With the "onnx" backend, the model is exported to onnx_dir (only the first
+    time) and run with ONNX Runtime on cpu, with the given numbers of threads."""
+    wav2vec_model_name = WAV2VEC_MODEL_NAME[language_code]
+    if backend == "onnx":
+        if device.type != "cpu" or precision != "fp32":
+            raise ValueError("the onnx backend is only supported on cpu with fp32")
+        model = OnnxModel(
+            export_onnx(wav2vec_model_name, onnx_dir),
+            intra_op_threads,
+            inter_op_threads,
+        )
+    elif backend != "torch":
+        raise ValueError(f"Unknown backend: {backend}")
+    elif lazy:
+        model = LazyModel(wav2vec_model_name, device, precision)
+    else:
+        model = load_pretrained_model(wav2vec_model_name, device, precision)
+    tokenizer = Wav2Vec2CTCTokenizer.from_pretrained(wav2vec_model_name)
+    feature_extractor = Wav2Vec2FeatureExtractor(
+        feature_size=1,
+        sampling_rate=SR,
+        padding_value=0.0,
+        do_normalize=True,
+        return_attention_mask=True,
+    )
+    processor = Wav2Vec2Processor(feature_extractor, tokenizer)
+    return model, tokenizer, processor
+
+
+def write_word_segments(
+    out_file: Path,
+    word_segments: forced_alignment.SegmentArray,
+    failed_segments: list[dict],
+):
+    """writes the output of the forced-alignment of a wav file to a json file"""
+    word_segments = [
+        {
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "word": label,
+            "text": original_label,
+        }
+        for start, end, label, original_label in zip(
+            word_segments.start.tolist(),
+            word_segments.end.tolist(),
+            word_segments.labels,
+            word_segments.original_labels,
+        )
+    ]
+
+    with open(out_file, "w") as f:
+        json.dump(
+            {
+                "word_segments": word_segments,
+                "failed_segments": failed_segments,
+            },
+            f,
+        )
+
+
+class OutputWriter(threading.Thread):
+    def __init__(
+        self, alignment_store: AlignmentStore = None, stream_log: StreamLog = None
+    ):
+        """background thread that writes the outputs of the talks,
+        so that serialization does not block the inference
+
+        Args:
+            alignment_store (AlignmentStore, optional): store where the outputs
+                are also saved (if they are written with a key)
+            stream_log (StreamLog, optional): log where the talks are added
+                once their outputs are written
+        """
+        super().__init__(daemon=True)
+        self.queue = queue.Queue()
+        self.alignment_store = alignment_store
+        self.stream_log = stream_log
+        self.idle_time, self.busy_time = 0.0, 0.0
+
+    def write(
+        self,
+        out_file: Path,
+        word_segments: forced_alignment.SegmentArray,
+        failed_segments: list[dict],
+        store_key: str = None,
+    ):
+        self.queue.put((out_file, word_segments, failed_segments, store_key))
+
+    def close(self):
+        """waits until all the outputs are written"""
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            start_time = time.perf_counter()
+            item = self.queue.get()
+            self.idle_time += time.perf_counter() - start_time
+            if item is None:
+                break
+
+            start_time = time.perf_counter()
+            out_file, word_segments, failed_segments, store_key = item
+            write_word_segments(out_file, word_segments, failed_segments)
+            if store_key is not None:
+                self.alignment_store.put(store_key, out_file)
+            if self.stream_log is not None:
+                self.stream_log.add(out_file.stem)
+            self.busy_time += time.perf_counter() - start_time
+
+
+def memory_usage_mb() -> tuple[float, float]:
+    """peak resident set size of the process and its current proportional
+    set size (shared pages divided among the processes that share them)"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    pss = float("nan")
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss, pss
+
+
+def align_talks_in_process(
+    worker_idx: int,
+    num_threads: int,
+    talk_queue: multiprocessing.Queue,
+    result_queue: multiprocessing.Queue,
+    args: argparse.Namespace,
+    model: Wav2Vec2ForCTC,
+    tokenizer: Wav2Vec2CTCTokenizer,
+    processor: Wav2Vec2Processor,
+    emission_cache: EmissionCache,
+    alignment_store: AlignmentStore = None,
+    store_keys: dict = None,
+    cleaned_texts: dict[str, str] = None,
+):
+    """worker of the --num-procs mode, which aligns the talks of the queue
+    one at a time, with the (copy-on-write) model of the parent process
+
+    Args:
+        worker_idx (int): index of the worker
+        num_threads (int): number of intra-op threads (and cores) of the worker
+        talk_queue (multiprocessing.Queue): (talk id, segments) of the talks
+            to align, and None at the end
+        result_queue (multiprocessing.Queue): (talk id, seconds of audio, number of
+            long segments, number of recovered long segments) of each aligned talk
+            (None if it failed), the traceback of an unexpected error (which stops
+            the worker), and the counts of the examples that did not need the
+            model (see "WavDataset.plan_counts") and the memory usage of the
+            worker at the end
+    """
+    torch.set_num_threads(num_threads)
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        worker_cores = cores[worker_idx * num_threads : (worker_idx + 1) * num_threads]
+        if len(worker_cores) == num_threads:
+            os.sched_setaffinity(0, worker_cores)
+    if isinstance(model, OnnxModel) and model.intra_op_threads is None:
+        # the session of the worker is created on its first batch
+        model.intra_op_threads = num_threads
+
+    device = torch.device("cpu")
+    wav_dir = Path(args.path_to_wav)
+    out_dir = Path(args.path_to_output_dir)
+    frame_budget = FrameBudget()
+    plan_counts = Counter()
+    try:
+        for talk_id, talk_segments in iter(talk_queue.get, None):
+            wav_file = wav_dir / f"{talk_id}.wav"
+            try:
+                word_segments, failed_segments = get_word_segments_for_wav(
+                    wav_file,
+                    talk_segments,
+                    model,
+                    processor,
+                    tokenizer.encoder,
+                    args.language_code,
+                    device,
+                    args.max_seconds_example,
+                    args.max_seconds_batch,
+                    args.trellis_backend,
+                    args.band_width if args.align_long_segments else 0,
+                    args.max_trellis_mb,
+                    args.blank_threshold,
+                    emission_cache,
+                    frame_budget,
+                    args.text_aligner,
+                    cleaned_texts,
+                    plan_counts,
+                )
+            except (RuntimeError, OSError):
+                print(f"Failed forced-alignment, skipping file: {wav_file}")
+                result_queue.put((talk_id, None))
+                continue
+
+            out_file = out_dir / f"{talk_id}.json"
+            write_word_segments(out_file, word_segments, failed_segments)
+            if alignment_store is not None and talk_id in store_keys:
+                alignment_store.put(store_keys[talk_id], out_file)
+
+            num_long = sum(
+                sgm["duration"] > args.max_seconds_example for sgm in talk_segments
+            )
+            result_queue.put(
+                (
+                    talk_id,
+                    (
+                        sum(sgm["duration"] for sgm in talk_segments),
+                        num_long,
+                        num_long
+                        - sum(sgm["flag"] == "long" for sgm in failed_segments),
+                    ),
+                )
+            )
+    except Exception:
+        # the parent stops with the error, instead of waiting for the worker
+        result_queue.put(("error", traceback.format_exc()))
+    finally:
+        result_queue.put(("plan", plan_counts))
+        result_queue.put(("memory", memory_usage_mb()))
+
+
+# seconds between the checks of the workers of the --num-procs mode
+WORKER_POLL_SECONDS = 10
+
+
+def get_word_segments_multiprocess(
+    args: argparse.Namespace,
+    talk_ids: list[str],
+    segments_per_talk: dict,
+    model: Wav2Vec2ForCTC,
+    tokenizer: Wav2Vec2CTCTokenizer,
+    processor: Wav2Vec2Processor,
+    emission_cache: EmissionCache,
+    alignment_store: AlignmentStore = None,
+    store_keys: dict = None,
+    stream_log: StreamLog = None,
+    cleaned_texts: dict[str, str] = None,
+) -> dict:
+    """aligns the talks with --num-procs processes on cpu, which are forked
+    after loading the model, so that they all share its weights
+
+    Args:
+        alignment_store (AlignmentStore, optional): store for the outputs
+        store_keys (dict, optional): key of each talk in the alignment store
+        stream_log (StreamLog, optional): log of the talks that are written
+        cleaned_texts (dict[str, str], optional): as in WavDataset
+
+    Returns:
+        dict: the throughput (seconds of audio per second) and memory usage (MB)
+    """
+    # the weights are moved to shared memory, so that the workers never copy them
+    # (with copy-on-write, even reading them can copy the pages of the tensors)
+    model.share_memory()
+
+    num_cores = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count()
+    )
+    num_threads = args.threads_per_proc or max(1, num_cores // args.num_procs)
+
+    # longest talks first, to reduce the time waiting for the last ones
+    talk_ids = sorted(
+        talk_ids,
+        key=lambda talk_id: sum(sgm["duration"] for sgm in segments_per_talk[talk_id]),
+        reverse=True,
+    )
+
+    context = multiprocessing.get_context("fork")
+    talk_queue, result_queue = context.Queue(), context.Queue()
+    for talk_id in talk_ids:
+        talk_queue.put((talk_id, segments_per_talk[talk_id]))
+    for _ in range(args.num_procs):
+        talk_queue.put(None)
+
+    start_time = time.perf_counter()
+    workers = [
+        context.Process(
+            target=align_talks_in_process,
+            args=(
+                worker_idx,
+                num_threads,
+                talk_queue,
+                result_queue,
+                args,
+                model,
+                tokenizer,
+                processor,
+                emission_cache,
+                alignment_store,
+                store_keys,
+                cleaned_texts,
+            ),
+        )
+        for worker_idx in range(args.num_procs)
+    ]
+    for worker in workers:
+        worker.start()
+
+    total_seconds, num_long_segments, num_recovered = 0.0, 0, 0
+    plan_counts, worker_memory = Counter(), []
+    try:
+        with tqdm(total=len(talk_ids)) as progress_bar:
+            while len(worker_memory) < args.num_procs:
+                try:
+                    key, result = result_queue.get(timeout=WORKER_POLL_SECONDS)
+                except queue.Empty:
+                    # a worker that is killed (e.g. out of memory) sends nothing
+                    for worker in workers:
+                        if worker.exitcode not in (None, 0):
+                            raise RuntimeError(
+                                f"A worker exited with code {worker.exitcode}"
+                            )
+                    if not any(worker.is_alive() for worker in workers):
+                        raise RuntimeError("The workers exited without their results")
+                    continue
+                if key == "error":
+                    raise RuntimeError(f"Failed worker:\n{result}")
+                if key == "plan":
+                    plan_counts.update(result)
+                    continue
+                if key == "memory":
+                    worker_memory.append(result)
+                    continue
+                if result is not None:
+                    total_seconds += result[0]
+                    num_long_segments += result[1]
+                    num_recovered += result[2]
+                    # the output of the talk was written by the worker
+                    if stream_log is not None:
+                        stream_log.add(key)
+                progress_bar.update()
+    finally:
+        for worker in workers:
+            if worker.is_alive() and len(worker_memory) < args.num_procs:
+                worker.terminate()
+            worker.join()
+    total_time = time.perf_counter() - start_time
+
+    # the talks are planned by the workers, so it is only known at the end
+    print(format_plan_summary(plan_counts))
+    if args.align_long_segments:
+        print(
+            f"Recovered {num_recovered} out of {num_long_segments} long segments "
+            f"(> {args.max_seconds_example} seconds)"
+        )
+
+    parent_rss, parent_pss = memory_usage_mb()
+    stats = {
+        "audio_seconds_per_second": total_seconds / total_time,
+        "parent_rss_mb": parent_rss,
+        "worker_peak_rss_mb": max(rss for rss, _ in worker_memory),
+        "total_pss_mb": parent_pss + sum(pss for _, pss in worker_memory),
+    }
+    print(
+        f"Finished in {total_time:.1f}s with {args.num_procs} processes "
+        f"x {num_threads} threads: "
+        f"{stats['audio_seconds_per_second']:.1f} seconds of audio per second, "
+        f"RSS {stats['parent_rss_mb']:.0f} MB (parent), "
+        f"{stats['worker_peak_rss_mb']:.0f} MB (peak of a worker), "
+        f"PSS {stats['total_pss_mb']:.0f} MB (total)"
+    )
+    return stats
+
+
+def alignment_settings(args) -> dict:
+    """options of get_word_segments.py that change its outputs
+    (part of the keys of the alignment store)"""
+    return {
+        "max_seconds_example": args.max_seconds_example,
+        "max_seconds_batch": args.max_seconds_batch,
+        # the processes align a talk at a time
+        "batching": "talk" if args.num_procs > 1 else args.batching,
+        "align_long_segments": args.align_long_segments,
+        "band_width": args.band_width,
+        "max_trellis_mb": args.max_trellis_mb,
+        "blank_threshold": args.blank_threshold,
+        "emission_mode": args.emission_mode,
+        "window_seconds": args.window_seconds,
+        "text_aligner": args.text_aligner,
+        # the emissions of a run with the emission cache are rounded to its dtype
+        "emission_dtype": (
+            np.dtype(EMISSION_DTYPE).name
+            if args.emission_cache_dir is not None
+            else "float32"
+        ),
+    }
+
+
+def get_word_segments(args, loaded_model: tuple = None):
+    """aligns the talks of args (the options of get_word_segments.py),
+    with --stream-log, adding them to the log of the output dir
+    as they are written, and finishing it even if the alignment fails"""
+    if not args.stream_log:
+        return align_talks(args, loaded_model)
+
+    out_dir = Path(args.path_to_output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stream_log = StreamLog(out_dir / STREAM_LOG_NAME)
+    try:
+        result = align_talks(args, loaded_model, stream_log)
+    except BaseException:
+        stream_log.finish(ok=False)
+        raise
+    stream_log.finish()
+    return result
+
+
+def align_talks(args, loaded_model: tuple = None, stream_log: StreamLog = None):
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
+    # the emissions (and outputs) depend on the precision and backend of the model
+    model_name = WAV2VEC_MODEL_NAME[args.language_code]
+    if args.precision != "fp32":
+        model_name += f"|{args.precision}"
+    if args.backend != "torch":
+        model_name += f"|{args.backend}"
+
+    emission_cache = None
+    if args.emission_cache_dir is not None:
+        emission_cache = EmissionCache(
+            args.emission_cache_dir, model_name, args.emission_cache_size_gb
+        )
+
+    # the workers of --num-procs share the model that is loaded before forking them
+    if loaded_model is not None:
+        # (model, tokenizer, processor) kept warm by the alignment server
+        model, tokenizer, processor = loaded_model
+    else:
+        model, tokenizer, processor = load_model(
+            args.language_code,
+            device,
+            lazy=(emission_cache is not None or args.alignment_store_dir is not None)
+            and args.num_procs == 1,
+            precision=args.precision,
+            backend=args.backend,
+            onnx_dir=args.onnx_dir,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+        )
+
+    wav_dir = Path(args.path_to_wav)
+    out_dir = Path(args.path_to_output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    segments_per_talk = load_data(args.path_to_yaml, args.path_to_txt)
+
+    if args.emission_mode == "talk" and (args.num_procs > 1 or args.batching != "talk"):
+        raise ValueError(
+            "--emission-mode talk is only supported with --batching talk "
+            "and a single process"
+        )
+
+    talk_ids = [
+        talk_id
+        for talk_id in segments_per_talk.keys()
+        if not (out_dir / f"{talk_id}.json").exists() or args.override_files
+    ]
+
+    alignment_store, store_keys = None, {}
+    if args.alignment_store_dir is not None:
+        # the talks are reused if their inputs did not change, and aligned
+        # otherwise (even if their output file exists)
+        alignment_store = AlignmentStore(args.alignment_store_dir)
+        settings = alignment_settings(args)
+        talk_ids, num_reused = [], 0
+        for talk_id, talk_segments in segments_per_talk.items():
+            try:
+                audio_digest = file_digest(wav_dir / f"{talk_id}.wav")
+            except OSError:
+                # missing audio, which fails as usual
+                talk_ids.append(talk_id)
+                continue
+            key = talk_key(audio_digest, talk_segments, model_name, settings)
+            if not args.override_files and alignment_store.restore(
+                key, out_dir / f"{talk_id}.json"
+            ):
+                num_reused += 1
+            else:
+                talk_ids.append(talk_id)
+                store_keys[talk_id] = key
+        print(f"Reused {num_reused} talks from the alignment store")
+
+    if stream_log is not None:
+        # the talks that are already written
+        talk_ids_to_align = set(talk_ids)
+        for talk_id in segments_per_talk.keys():
+            if talk_id not in talk_ids_to_align:
+                stream_log.add(talk_id)
+
+    # the texts of all the talks are cleaned at once (and passed
+    # to the datasets of the talks, also in the processes of --num-procs)
+    original_txts = [
+        sgm["text"] for talk_id in talk_ids for sgm in segments_per_talk[talk_id]
+    ]
+    cleaned_txts = text_cleaning.clean_texts(
+        original_txts,
+        args.language_code,
+        num_workers=args.cleaning_workers,
+        cache=(
+            text_cleaning.TextCleaningCache(args.text_cache_dir)
+            if args.text_cache_dir is not None
+            else None
+        ),
+    )
+    cleaned_texts = dict(zip(original_txts, cleaned_txts))
+
+    if args.num_procs > 1:
+        if device.type != "cpu":
+            raise ValueError("--num-procs is only supported on cpu")
+        return get_word_segments_multiprocess(
+            args,
+            talk_ids,
+            segments_per_talk,
+            model,
+            tokenizer,
+            processor,
+            emission_cache,
+            alignment_store,
+            store_keys,
+            stream_log,
+            cleaned_texts,
+        )
+
+    talks = [
+        WavDataset(
+            wav_dir / f"{talk_id}.wav",
+            segments_per_talk[talk_id],
+            tokenizer.encoder,
+            args.language_code,
+            args.max_seconds_example,
+            emission_cache,
+            load_audio=args.emission_mode == "segment",
+            cleaned_texts=cleaned_texts,
+        )
+        for talk_id in talk_ids
+    ]
+
+    # the workers prefetch the next batches,
+    # while the main process runs the model and the alignment
+    dataset = TalksDataset(talks, args.max_seconds_batch, args.batching)
+    print(dataset.plan_summary())
+    if args.emission_mode == "segment":
+        print(
+            f"{len(dataset)} batches ({args.batching} batching), "
+            f"padding ratio: {dataset.padding_ratio():.1%}"
+        )
+    else:
+        print(
+            f"{len(dataset)} batches, with the emissions of the talks "
+            f"in windows of {args.window_seconds} seconds"
+        )
+    dataloader = DataLoader(
+        dataset,
+        collate_fn=dataset.my_collate_fn,
+        num_workers=args.num_workers,
+    )
+    writer = OutputWriter(alignment_store, stream_log)
+    writer.start()
+
+    # results of each talk, by segment index, and number of segments to align
+    results = [dict(talk.planned_results) for talk in talks]
+    remaining_segments = [len(talk.to_align) for talk in talks]
+    failed_talks = set()
+    num_long_segments, num_recovered = 0, 0
+    load_time, wait_time, busy_time = 0.0, 0.0, 0.0
+    # batches that run out of memory are split, instead of skipping their talks
+    frame_budget = FrameBudget()
+    # with --emission-mode talk, the emission of each talk until it is finished
+    talk_emissions = {}
+
+    def get_talk_emission_once(talk_idx: int) -> torch.Tensor:
+        if talk_idx not in talk_emissions:
+            talk_emissions[talk_idx] = get_talk_emission(
+                talks[talk_idx].path_to_wav,
+                model,
+                processor,
+                device,
+                args.window_seconds,
+                args.max_seconds_batch,
+                emission_cache,
+                frame_budget,
+            )
+        return talk_emissions[talk_idx]
+
+    def get_batch_emissions(
+        items: list[tuple[int, int]], batch: tuple
+    ) -> tuple[list[torch.Tensor], list[float]]:
+        """the emissions of a batch and the start of their first frames"""
+        if args.emission_mode == "segment":
+            emissions = get_emissions_with_cache(
+                batch[0],
+                batch[5],
+                batch[6],
+                model,
+                processor,
+                device,
+                emission_cache,
+                frame_budget,
+            )
+            return emissions, batch[3]
+
+        emissions, emission_offsets = [], []
+        for (talk_idx, _), offset, duration in zip(items, batch[3], batch[4]):
+            emission, emission_offset = slice_talk_emission(
+                get_talk_emission_once(talk_idx), offset, duration
+            )
+            emissions.append(emission)
+            emission_offsets.append(emission_offset)
+        return emissions, emission_offsets
+
+    def finish_talk(talk_idx: int):
+        nonlocal num_long_segments, num_recovered
+        wav_file = talks[talk_idx].path_to_wav
+        if talk_idx not in failed_talks:
+            try:
+                talk_emission = None
+                if (
+                    args.emission_mode == "talk"
+                    and args.align_long_segments
+                    and talks[talk_idx].long_segments
+                ):
+                    talk_emission = get_talk_emission_once(talk_idx)
+                word_segments, long_segments = align_long_segments(
+                    wav_file,
+                    talks[talk_idx].long_segments,
+                    model,
+                    processor,
+                    tokenizer.encoder,
+                    args.language_code,
+                    device,
+                    args.max_seconds_example,
+                    args.max_seconds_batch,
+                    args.band_width if args.align_long_segments else 0,
+                    args.max_trellis_mb,
+                    args.trellis_backend,
+                    emission_cache,
+                    frame_budget,
+                    talk_emission,
+                    args.text_aligner,
+                )
+            except (RuntimeError, OSError):
+                failed_talks.add(talk_idx)
+        talk_emissions.pop(talk_idx, None)
+
+        if talk_idx in failed_talks:
+            print(f"Failed forced-alignment, skipping file: {wav_file}")
+        else:
+            # in the order of the segments of the talk, as in "get_word_segments_for_wav"
+            all_word_segments, failed_segments = split_results(
+                [results[talk_idx][idx] for idx in sorted(results[talk_idx])], [], []
+            )
+            word_segments, failed_segments = combine_segments(
+                all_word_segments + word_segments, long_segments, failed_segments
+            )
+            writer.write(
+                out_dir / f"{talk_ids[talk_idx]}.json",
+                word_segments,
+                failed_segments,
+                store_key=store_keys.get(talk_ids[talk_idx]),
+            )
+
+            if args.align_long_segments:
+                num_long_segments += len(talks[talk_idx].long_segments)
+                num_recovered += len(talks[talk_idx].long_segments) - len(long_segments)
+        results[talk_idx] = None
+
+    def store_results(items: list[tuple[int, int]], batch_results: list = None):
+        """stores the results of a batch (None if it failed) and
+        finishes the talks as soon as all their segments are aligned"""
+        for i, (talk_idx, idx) in enumerate(items):
+            if batch_results is None:
+                failed_talks.add(talk_idx)
+            else:
+                results[talk_idx][idx] = batch_results[i]
+            remaining_segments[talk_idx] -= 1
+            if remaining_segments[talk_idx] == 0:
+                finish_talk(talk_idx)
+                progress_bar.update()
+
+    # with --align-workers, the alignment of a batch is done by a pool of
+    # processes, which get the emissions through shared memory
+    align_pool = None
+    if args.align_workers > 0:
+        # the workers have to share the resource tracker of the main process,
+        # which owns (and unlinks) the blocks of shared memory
+        resource_tracker.ensure_running()
+        align_pool = Pool(args.align_workers, initializer=init_align_worker)
+    pending_batches = deque()
+
+    def collect_results(block: bool):
+        """stores the results of the pool, in the order of the batches"""
+        while pending_batches and (block or pending_batches[0][0].ready()):
+            async_result, shm, items = pending_batches.popleft()
+            try:
+                batch_results = async_result.get()
+            except RuntimeError:
+                batch_results = None
+            finally:
+                shm.close()
+                shm.unlink()
+            store_results(items, batch_results)
+
+    print("Iterating through talks ...")
+    start_time = time.perf_counter()
+    with torch.no_grad(), tqdm(total=len(talks)) as progress_bar:
+        for talk_idx in range(len(talks)):
+            if remaining_segments[talk_idx] == 0:
+                finish_talk(talk_idx)
+                progress_bar.update()
+
+        batches = iter(dataloader)
+        while True:
+            wait_start_time = time.perf_counter()
+            try:
+                items, batch, failed_items, batch_load_time = next(batches)
+            except StopIteration:
+                break
+            wait_time += time.perf_counter() - wait_start_time
+            load_time += batch_load_time
+
+            busy_start_time = time.perf_counter()
+            store_results(failed_items)
+            if batch is None:
+                pass
+            elif align_pool is None:
+                try:
+                    emissions, emission_offsets = get_batch_emissions(items, batch)
+                    batch_results = align_emissions(
+                        emissions,
+                        *batch[1:5],
+                        tokenizer.encoder,
+                        args.language_code,
+                        args.trellis_backend,
+                        args.blank_threshold,
+                        emission_offsets,
+                        batch[7],
+                        args.text_aligner,
+                    )
+                except (RuntimeError, OSError):
+                    batch_results = None
+                store_results(items, batch_results)
+            else:
+                try:
+                    emissions, emission_offsets = get_batch_emissions(items, batch)
+                except (RuntimeError, OSError):
+                    store_results(items)
+                else:
+                    shm = share_emissions(emissions)
+                    async_result = align_pool.apply_async(
+                        align_shared_emissions,
+                        (
+                            shm.name,
+                            [
+                                emission.size(0) if emission is not None else None
+                                for emission in emissions
+                            ],
+                            next((e.size(1) for e in emissions if e is not None), 0),
+                            *batch[1:5],
+                            tokenizer.encoder,
+                            args.language_code,
+                            args.trellis_backend,
+                            args.blank_threshold,
+                            emission_offsets,
+                            batch[7],
+                            args.text_aligner,
+                        ),
+                    )
+                    pending_batches.append((async_result, shm, items))
+                # the main process goes on with the next batch, unless
+                # the pool is falling behind
+                collect_results(block=False)
+                while len(pending_batches) > 2 * args.align_workers:
+                    pending_batches[0][0].wait()
+                    collect_results(block=False)
+            busy_time += time.perf_counter() - busy_start_time
+
+        collect_results(block=True)
+        if align_pool is not None:
+            align_pool.close()
+            align_pool.join()
+
+    writer.close()
+    total_time = time.perf_counter() - start_time
+
+    if args.align_long_segments:
+        print(
+            f"Recovered {num_recovered} out of {num_long_segments} long segments "
+            f"(> {args.max_seconds_example} seconds)"
+        )
+
+    # with no workers, the batches are loaded in the main process
+    loading_idle_time = max(0.0, args.num_workers * total_time - load_time)
+    print(
+        f"Finished in {total_time:.1f}s. Idle time per stage: "
+        f"loading {loading_idle_time:.1f}s ({args.num_workers} workers), "
+        f"inference {total_time - busy_time:.1f}s "
+        f"(of which {wait_time:.1f}s waiting for batches), "
+        f"writing {writer.idle_time:.1f}s"
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """the options of get_word_segments.py"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--language-code", "-lang", type=str, required=True)
+    parser.add_argument("--path-to-wav", "-wav", type=str, required=True)
+    parser.add_argument("--path-to-txt", "-txt", type=str, required=True)
+    parser.add_argument("--path-to-yaml", "-yaml", type=str, required=True)
+    parser.add_argument("--path-to-output-dir", "-out", type=str, required=True)
+    parser.add_argument("--max-seconds-example", "-max1", type=float, default=60)
+    parser.add_argument("--max-seconds-batch", "-max2", type=float, default=60)
+    parser.add_argument("--override-files", "-ovr", action="store_true")
+    parser.add_argument(
+        "--trellis-backend",
+        type=str,
+        default="torch",
+        choices=list(forced_alignment.TRELLIS_BACKENDS.keys()),
+    )
+    # mapping of the clean text to the original one (see forced_alignment.py)
+    parser.add_argument(
+        "--text-aligner",
+        type=str,
+        default="dp",
+        choices=list(forced_alignment.TEXT_ALIGNERS.keys()),
+    )
+    parser.add_argument("--align-long-segments", "-long", action="store_true")
+    parser.add_argument("--band-width", type=int, default=500)
+    parser.add_argument("--max-trellis-mb", type=float, default=2048)
+    parser.add_argument("--blank-threshold", type=float, default=None)
+    parser.add_argument("--emission-cache-dir", type=str, default=None)
+    parser.add_argument("--alignment-store-dir", type=str, default=None)
+    # NDJSON log of the written talks, for get_source_text.py --follow
+    parser.add_argument("--stream-log", action="store_true")
+    parser.add_argument("--emission-cache-size-gb", type=float, default=50)
+    parser.add_argument("--text-cache-dir", type=str, default=None)
+    parser.add_argument("--cleaning-workers", type=int, default=0)
+    parser.add_argument("--num-workers", type=int, default=2)
+    parser.add_argument("--align-workers", type=int, default=0)
+    parser.add_argument("--num-procs", type=int, default=1)
+    parser.add_argument("--threads-per-proc", type=int, default=None)
+    parser.add_argument("--precision", type=str, default="fp32", choices=PRECISIONS)
+    parser.add_argument(
+        "--backend", type=str, default="torch", choices=["torch", "onnx"]
+    )
+    parser.add_argument("--onnx-dir", type=str, default=str(DEFAULT_ONNX_DIR))
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    # send the job to a running alignment_server.py instead of loading the model
+    parser.add_argument("--socket", type=str, default=None)
+    parser.add_argument(
+        "--batching", type=str, default="talk", choices=["talk", "global"]
+    )
+    parser.add_argument(
+        "--emission-mode", type=str, default="segment", choices=["segment", "talk"]
+    )
+    parser.add_argument("--window-seconds", type=float, default=30)
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
 
-    get_word_segments(args)
+    if args.socket is not None:
+        request_alignment(args.socket, vars(args))
+    else:
+        get_word_segments(args)
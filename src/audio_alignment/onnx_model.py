@@ -0,0 +1,176 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from constants import SR, WAV2VEC_MODEL_NAME, N
+from transformers import Wav2Vec2ForCTC
+from transformers.modeling_outputs import CausalLMOutput
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+DEFAULT_ONNX_DIR = Path.home() / ".cache" / "segaugment" / "onnx"
+
+
+def onnx_path(onnx_dir: Path, model_name: str) -> Path:
+    """path of the exported graph of a pretrained model"""
+    return Path(onnx_dir) / f"{model_name.replace('/', '--')}.onnx"
+
+
+def export_onnx(
+    model_name: str, onnx_dir: Path, opset: int = 14, override: bool = False
+) -> Path:
+    """exports a pretrained wav2vec2.0 model to an ONNX graph with dynamic batch
+    and time axes (only once, unless override)
+
+    Args:
+        model_name (str): name of the pretrained model
+        onnx_dir (Path): directory where the exported graphs are cached
+        opset (int, optional): ONNX opset version
+        override (bool, optional): export again if the graph already exists
+
+    Returns:
+        Path: path to the exported graph
+    """
+    path = onnx_path(onnx_dir, model_name)
+    if path.exists() and not override:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    model = Wav2Vec2ForCTC.from_pretrained(model_name).eval()
+    input_values = torch.randn(2, SR)
+    attention_mask = torch.ones(2, SR, dtype=torch.long)
+    attention_mask[1, SR // 2 :] = 0
+
+    # export and rename, for other processes that might be loading the graph
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (input_values, attention_mask),
+            str(tmp_path),
+            input_names=["input_values", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_values": {0: "batch", 1: "time"},
+                "attention_mask": {0: "batch", 1: "time"},
+                "logits": {0: "batch", 1: "frames"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+class OnnxModel:
+    def __init__(
+        self,
+        path: Path,
+        intra_op_threads: int = None,
+        inter_op_threads: int = None,
+    ):
+        """wav2vec2.0 model exported with "export_onnx", run with ONNX Runtime on cpu,
+        with the same interface as Wav2Vec2ForCTC. The session is only created
+        the first time it is called (never, if all the emissions are in the
+        cache), and each forked process creates its own.
+
+        Args:
+            path (Path): path to the exported graph
+            intra_op_threads (int, optional): threads within an operator
+                (by default, as many as cores)
+            inter_op_threads (int, optional): threads across operators
+        """
+        if onnxruntime is None:
+            raise ImportError("the onnx backend requires onnxruntime")
+        self.path = path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.session = None
+        self.session_pid = None
+
+    def _get_session(self) -> "onnxruntime.InferenceSession":
+        if self.session is None or self.session_pid != os.getpid():
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = (
+                onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            )
+            if self.intra_op_threads is not None:
+                options.intra_op_num_threads = self.intra_op_threads
+            if self.inter_op_threads is not None:
+                options.inter_op_num_threads = self.inter_op_threads
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+            self.session = onnxruntime.InferenceSession(
+                str(self.path), options, providers=["CPUExecutionProvider"]
+            )
+            self.session_pid = os.getpid()
+        return self.session
+
+    def __call__(
+        self, input_values: torch.Tensor, attention_mask: torch.Tensor = None
+    ) -> CausalLMOutput:
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_values, dtype=torch.long)
+        (logits,) = self._get_session().run(
+            ["logits"],
+            {
+                "input_values": input_values.cpu().numpy().astype(np.float32),
+                "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+            },
+        )
+        return CausalLMOutput(logits=torch.from_numpy(logits))
+
+    def share_memory(self):
+        """nothing to share, each process has its own session"""
+        return self
+
+
+def logits_parity(
+    model: Wav2Vec2ForCTC,
+    onnx_model: OnnxModel,
+    input_values: torch.Tensor,
+    attention_mask: torch.Tensor,
+) -> float:
+    """maximum absolute difference between the logits of the torch and the
+    onnx models, in the frames that are not padding"""
+    with torch.no_grad():
+        torch_logits = model(input_values, attention_mask=attention_mask).logits
+    onnx_logits = onnx_model(input_values, attention_mask=attention_mask).logits
+    num_frames = min(torch_logits.size(1), onnx_logits.size(1))
+    diff = (torch_logits[:, :num_frames] - onnx_logits[:, :num_frames]).abs()
+    # the padded frames of each example are not used
+    true_lens = attention_mask.sum(dim=1) // N
+    frame_mask = torch.arange(num_frames)[None, :] < true_lens[:, None]
+    return diff[frame_mask].max().item()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="exports the wav2vec2.0 model of a language to ONNX "
+        "(for get_word_segments.py --backend onnx)"
+    )
+    parser.add_argument("--language-code", "-lang", type=str, required=True)
+    parser.add_argument("--onnx-dir", type=str, default=str(DEFAULT_ONNX_DIR))
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--override-files", "-ovr", action="store_true")
+    args = parser.parse_args()
+
+    model_name = WAV2VEC_MODEL_NAME[args.language_code]
+    path = export_onnx(model_name, args.onnx_dir, args.opset, args.override_files)
+    print(f"Exported {model_name} to {path}")
+
+    # parity on a padded random batch
+    input_values = torch.randn(2, 5 * SR)
+    attention_mask = torch.ones(2, 5 * SR, dtype=torch.long)
+    attention_mask[1, 3 * SR :] = 0
+    diff = logits_parity(
+        Wav2Vec2ForCTC.from_pretrained(model_name).eval(),
+        OnnxModel(path),
+        input_values,
+        attention_mask,
+    )
+    print(f"Max absolute difference of the logits (torch vs onnx): {diff:.2e}")
@@ -47,16 +47,30 @@ conda activate seg_augment
 
 forced_alignment_dir=${OUTPUT_ROOT}/forced_alignment/${dataset_name}/${src_lang}
 
+# the source text of each talk is extracted as soon as it is aligned
+rm -f $forced_alignment_dir/word_segments.ndjson
+
 python ${SEGAUGMENT_ROOT}/src/audio_alignment/get_word_segments.py \
     -lang $src_lang \
     -wav $wav_dir \
     -txt $original_src \
     -yaml $original_yaml \
-    -out $forced_alignment_dir
+    -out $forced_alignment_dir \
+    --stream-log \
+    ${ALIGNMENT_SOCKET:+--socket $ALIGNMENT_SOCKET} \
+    ${ALIGNMENT_STORE_DIR:+--alignment-store-dir $ALIGNMENT_STORE_DIR} \
+    ${TEXT_CACHE_DIR:+--text-cache-dir $TEXT_CACHE_DIR} &
+forced_alignment_pid=$!
 
 ### SOURCE TEXT
 
 python $SEGAUGMENT_ROOT/src/audio_alignment/get_source_text.py \
     -new_yaml $synthetic_data_dir/new.yaml \
     -align $forced_alignment_dir \
-    -lang $src_lang
\ No newline at end of file
+    -lang $src_lang \
+    --follow \
+    --producer-pid $forced_alignment_pid
+source_text_status=$?
+
+wait $forced_alignment_pid || exit $?
+exit $source_text_status
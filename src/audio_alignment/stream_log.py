@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator
+
+# name of the log in the output dir of get_word_segments.py
+STREAM_LOG_NAME = "word_segments.ndjson"
+
+
+class StreamLog:
+    def __init__(self, path: Path):
+        """NDJSON log of the talks whose word segments are already written,
+        with a line for each talk and a last line when get_word_segments.py
+        finishes, that the next stages can follow (with "follow_stream_log")
+        while the alignment is running
+
+        Args:
+            path (Path): path of the log (truncated if it exists)
+        """
+        self.path = Path(path)
+        self.path.write_text("")
+
+    def _append(self, entry: dict):
+        # a single write of a line in append mode, since the processes
+        # of --num-procs add their talks to the same log
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, talk_id: str):
+        """adds a talk (after its output file is written)"""
+        self._append({"talk_id": talk_id})
+
+    def finish(self, ok: bool = True):
+        """marks the end of the log (ok is False if get_word_segments.py failed)"""
+        self._append({"done": True, "ok": ok})
+
+
+def is_running(pid: int) -> bool:
+    """checks if a process is running (and not a zombie waiting for its parent)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def follow_stream_log(
+    path: Path, poll_seconds: float = 1.0, producer_pid: int = None
+) -> Iterator[str]:
+    """yields the talk ids of a "StreamLog" as they are added,
+    until get_word_segments.py finishes
+
+    Args:
+        path (Path): path of the log, which might not exist yet
+        poll_seconds (float, optional): time to wait for new lines
+        producer_pid (int, optional): pid of get_word_segments.py, to stop
+            if it exits without finishing the log (e.g. before creating it)
+
+    Raises:
+        RuntimeError: if get_word_segments.py failed
+
+    Yields:
+        Iterator[str]: the ids of the talks whose word segments are written
+    """
+
+    def producer_exited() -> bool:
+        return producer_pid is not None and not is_running(producer_pid)
+
+    path = Path(path)
+    while not path.exists():
+        # checked again after the exit, which might have created it
+        if producer_exited() and not path.exists():
+            raise RuntimeError(f"get_word_segments.py exited without creating {path}")
+        time.sleep(poll_seconds)
+
+    with open(path) as f:
+        line, exited = "", False
+        while True:
+            # the last line might be incomplete while it is being written
+            line += f.readline()
+            if not line.endswith("\n"):
+                # after the exit, the log is read once more before giving up
+                if exited:
+                    raise RuntimeError(
+                        f"get_word_segments.py exited without finishing {path}"
+                    )
+                exited = producer_exited()
+                if not exited:
+                    time.sleep(poll_seconds)
+                continue
+            entry = json.loads(line)
+            line = ""
+            if entry.get("done"):
+                if not entry["ok"]:
+                    raise RuntimeError(f"get_word_segments.py failed (see {path})")
+                return
+            yield entry["talk_id"]
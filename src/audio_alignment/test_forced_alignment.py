@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import forced_alignment
+from forced_alignment import SegmentArray
+
+WORDS = (
+    "so I went back to the lab and we looked at the data again and again until "
+    "we found what was wrong with it"
+).split()
+SPEAKER = ["Speaker:"] * 25
+
+
+def merged_original(original_tokens: list[str], clean_tokens: list[str]) -> str:
+    """original text of the merged word segments of the clean tokens"""
+    mapping = forced_alignment.get_monolingual_alignments_dp(
+        original_tokens, clean_tokens, "en"
+    )
+    n = len(clean_tokens)
+    segments = SegmentArray.from_lists(
+        np.arange(n),
+        np.arange(n) + 1,
+        np.ones(n),
+        clean_tokens,
+        [mapping[i] for i in range(n)],
+    )
+    return " ".join(forced_alignment.merge_original(segments).original_labels)
+
+
+@pytest.mark.parametrize("position", [0, 10, len(WORDS)])
+def test_long_removed_block(position):
+    original_tokens = WORDS[:position] + SPEAKER + WORDS[position:]
+    clean_tokens = [word.upper() for word in WORDS]
+
+    mapping = forced_alignment.get_monolingual_alignments_dp(
+        original_tokens, clean_tokens, "en"
+    )
+
+    # the removed block goes with the next word (or with the last one, at the end)
+    if position < len(WORDS):
+        assert [mapping[i] for i in range(position)] == WORDS[:position]
+        assert mapping[position] == " ".join(SPEAKER + [WORDS[position]])
+    else:
+        assert [mapping[i] for i in range(position - 1)] == WORDS[:-1]
+        assert mapping[position - 1] == " ".join([WORDS[-1]] + SPEAKER)
+    assert merged_original(original_tokens, clean_tokens) == " ".join(original_tokens)
+
+
+def test_repeated_words():
+    original_tokens = "I think the the problem is is here".split()
+    clean_tokens = "I THINK THE THE PROBLEM IS IS HERE".split()
+    assert merged_original(original_tokens, clean_tokens) == " ".join(original_tokens)
+
+
+def test_spelled_out_number():
+    original_tokens = "in 1990 I had 25 dogs".split()
+    clean_tokens = "IN NINETEEN NINETY I HAD TWENTY FIVE DOGS".split()
+    mapping = forced_alignment.get_monolingual_alignments_dp(
+        original_tokens, clean_tokens, "en"
+    )
+    assert mapping[0] == "in"
+    assert mapping[7] == "dogs"
+    assert merged_original(original_tokens, clean_tokens) == " ".join(original_tokens)
+
+
+def test_greedy_fallback(monkeypatch):
+    monkeypatch.setattr(forced_alignment, "MONOLINGUAL_MAX_CELLS", 0)
+    original_tokens = "the quick brown fox".split()
+    clean_tokens = "THE QUICK BROWN FOX".split()
+    assert forced_alignment.get_monolingual_alignments_dp(
+        original_tokens, clean_tokens, "en"
+    ) == forced_alignment.get_monolingual_alignments(
+        original_tokens, clean_tokens, "en"
+    )
@@ -1,11 +1,31 @@
+import hashlib
 import html
+import os
 import re
+import sqlite3
 import string
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
 
 import nltk
+import numpy as np
 from constants import LANG_AND, LANG_CODES
 from num2words import num2words
 
+# part of the keys of the cache, to invalidate it if the cleaning changes
+CLEANING_RULES_VERSION = 1
+
+SPACES_PATTERN = re.compile(" +")
+# just parenthesis
+SIMPLE_EVENT_PATTERN = re.compile(r"\([^()]*\)")
+# parenthesis with punctuations, " . ... :, before or after
+ALL_EVENTS_PATTERN = re.compile(
+    r'"(\([^()]*\))"|"(\([^()]*\))|(\([^()]*\):)|(\([^()]*\)\.\.\.)|(\([^()]*\)\.)|(\([^()]*\))'
+)
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+SEPARATORS_PATTERN = re.compile(r"\|{2,}")
+
 
 def clean_speaker_name(text: str, lang: str) -> str:
     """removes speaker name that might appear in the beginning of the sentence
@@ -21,7 +41,7 @@ def clean_speaker_name(text: str, lang: str) -> str:
         for sentence in nltk.sent_tokenize(text, language=LANG_CODES[lang]):
             if ": " in sentence:
                 start_text, rest_text = sentence.split(": ", maxsplit=1)
-                start_tokens = re.sub(" +", " ", start_text).strip().split(" ")
+                start_tokens = SPACES_PATTERN.sub(" ", start_text).strip().split(" ")
                 num_start_tokens = len(start_tokens)
 
                 # XXX: one word, initials, all caps
@@ -47,11 +67,8 @@ def clean_event(text: str, lang: str) -> str:
         str: text without events
     """
 
-    # just parenthesis
-    simple_event_pattern = r"\([^()]*\)"
-
     if ": " in text:
-        for event in re.findall(simple_event_pattern, text):
+        for event in SIMPLE_EVENT_PATTERN.findall(text):
             # check if event contains actual text from a speaker: (XX: utterance) -> utterance
             if ": " in event:
                 event_text = event[1:-1]  # (xyz) -> xyz
@@ -62,15 +79,14 @@ def clean_event(text: str, lang: str) -> str:
                     text = text.replace(event, event_text_cleaned)
 
     # remove rest of the events
-    # parenthesis with punctuations, " . ... :, before or after
-    all_event_patterns = r'"(\([^()]*\))"|"(\([^()]*\))|(\([^()]*\):)|(\([^()]*\)\.\.\.)|(\([^()]*\)\.)|(\([^()]*\))'
-    text = re.sub(all_event_patterns, "", text)
+    text = ALL_EVENTS_PATTERN.sub("", text)
 
     text = text.replace(" -- -- ", " -- ")
 
     return text
 
 
+@lru_cache(maxsize=2**16)
 def my_num2words(token: str, lang: str) -> str:
     """spells out numbers in a string
 
@@ -83,8 +99,8 @@ def my_num2words(token: str, lang: str) -> str:
     """
     if token.isdigit():
         new_token = token
-    elif token.translate(str.maketrans("", "", string.punctuation)).isdigit():
-        new_token = token.translate(str.maketrans("", "", string.punctuation))
+    elif token.translate(PUNCTUATION_TABLE).isdigit():
+        new_token = token.translate(PUNCTUATION_TABLE)
     else:
         new_token = token
     if new_token.isdigit():
@@ -115,7 +131,7 @@ def clean_text(txt: str, lang: str) -> str:
     Returns:
         str: cleaned text
     """
-    txt = re.sub(" +", " ", txt.strip().replace("\t", " ").replace("\n", " "))
+    txt = SPACES_PATTERN.sub(" ", txt.strip().replace("\t", " ").replace("\n", " "))
     txt = handle_html_non_utf(txt, lang)
     txt = " ".join([my_num2words(token, lang) for token in txt.split()])
     txt = clean_event(txt, lang)
@@ -128,6 +144,175 @@ def clean_text(txt: str, lang: str) -> str:
         return ""
 
 
+class TextCleaningCache:
+    def __init__(self, cache_dir: Path):
+        """on-disk cache of the outputs of "clean_text" (an sqlite database),
+        that can be shared by several runs and language pairs with the same
+        transcripts
+
+        Args:
+            cache_dir (Path): directory of the cache
+        """
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / "cleaned_texts.sqlite"
+        self.connection = None
+        self.connection_pid = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # a connection can not be used by a forked process
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cleaned_texts "
+                "(key TEXT PRIMARY KEY, cleaned_text TEXT)"
+            )
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    @staticmethod
+    def key(txt: str, lang: str) -> str:
+        """sha1 of the text, its language and the version of the cleaning"""
+        content = f"{CLEANING_RULES_VERSION}|{lang}|{txt}"
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """returns the cleaned texts of the keys that are in the cache"""
+        connection = self._get_connection()
+        cleaned_txts = {}
+        # within the limit of parameters of an sqlite query
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            cleaned_txts.update(
+                connection.execute(
+                    "SELECT key, cleaned_text FROM cleaned_texts "
+                    f"WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+            )
+        return cleaned_txts
+
+    def put_many(self, cleaned_txts: dict[str, str]):
+        """adds the cleaned texts (by key) to the cache"""
+        connection = self._get_connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cleaned_texts VALUES (?, ?)",
+                cleaned_txts.items(),
+            )
+
+
+def clean_texts(
+    txts: list[str],
+    lang: str,
+    num_workers: int = 0,
+    cache: TextCleaningCache = None,
+) -> list[str]:
+    """cleans a batch of texts with "clean_text", only once for each different text
+
+    Args:
+        txts (list[str]): texts
+        lang (str): language id
+        num_workers (int, optional): processes that clean the texts
+            (in the main process if 0)
+        cache (TextCleaningCache, optional): on-disk cache of the cleaned texts
+
+    Returns:
+        list[str]: cleaned texts
+    """
+    cleaned = {}
+    to_clean = list(dict.fromkeys(txts))
+
+    if to_clean and cache is not None:
+        keys = {txt: cache.key(txt, lang) for txt in to_clean}
+        cached = cache.get_many(list(keys.values()))
+        for txt in to_clean:
+            if keys[txt] in cached:
+                cleaned[txt] = cached[keys[txt]]
+        to_clean = [txt for txt in to_clean if keys[txt] not in cached]
+
+    if to_clean:
+        if num_workers > 0 and len(to_clean) > num_workers:
+            with Pool(num_workers) as pool:
+                cleaned_txts = pool.starmap(
+                    clean_text,
+                    [(txt, lang) for txt in to_clean],
+                    chunksize=max(1, len(to_clean) // (4 * num_workers)),
+                )
+        else:
+            cleaned_txts = [clean_text(txt, lang) for txt in to_clean]
+        for txt, cleaned_txt in zip(to_clean, cleaned_txts):
+            cleaned[txt] = cleaned_txt
+        if cache is not None:
+            cache.put_many(
+                {
+                    keys[txt]: cleaned_txt
+                    for txt, cleaned_txt in zip(to_clean, cleaned_txts)
+                }
+            )
+
+    return [cleaned[txt] for txt in txts]
+
+
+class _SeparatorTable(dict):
+    """translation table that maps the characters out of the vocab to the separator
+    (remembering them, so that each character is only looked up once)"""
+
+    def __missing__(self, code_point: int) -> str:
+        self[code_point] = "|"
+        return "|"
+
+
+class TextTokenizer:
+    # one per vocab and language (see "for_vocab")
+    _instances = {}
+
+    def __init__(self, vocab: dict, lang: str):
+        """tokenizer of the outputs of "clean_text" for a wav2vec2.0 vocab,
+        with a translation table for the texts and a lookup table for the ids
+        of their characters, which are built once
+
+        Args:
+            vocab (dict): wav2vec2.0 vocab with mappings from chars to indices
+            lang (str): language id
+        """
+        self.lang = lang
+        chars = [c for c in vocab.keys() if len(c) == 1]
+        self.table = _SeparatorTable({ord(c): c for c in chars})
+        self.table[ord(" ")] = "|"
+        # id of each code point of the vocab (-1 for the rest)
+        self.id_table = np.full(max(map(ord, chars)) + 1, -1, dtype=np.int32)
+        for c in chars:
+            self.id_table[ord(c)] = vocab[c]
+
+    @classmethod
+    def for_vocab(cls, vocab: dict, lang: str):
+        """the tokenizer of a vocab and language (only built the first time)"""
+        key = (tuple(vocab.items()), lang)
+        if key not in cls._instances:
+            cls._instances[key] = cls(vocab, lang)
+        return cls._instances[key]
+
+    def tokenize(self, cleaned_txt: str) -> str:
+        """as "tokenize_text" """
+        if self.lang == "en":
+            # wav2vec2.0
+            cleaned_txt = cleaned_txt.upper()
+        else:
+            # XLS-R
+            cleaned_txt = cleaned_txt.lower()
+        tokenized_cleaned_txt = cleaned_txt.translate(self.table)
+        return SEPARATORS_PATTERN.sub("|", tokenized_cleaned_txt).strip("|")
+
+    def encode(self, tokenized_cleaned_txt: str) -> np.ndarray:
+        """the token ids (int32) of an output of "tokenize" """
+        code_points = np.frombuffer(
+            tokenized_cleaned_txt.encode("utf-32-le"), dtype=np.uint32
+        )
+        return self.id_table[code_points]
+
+
 def tokenize_text(cleaned_txt: str, vocab: dict, lang: str) -> str:
     """tokenizes the output of "clean_text" according to the wav2vec2.0 vocab
 
@@ -139,25 +324,4 @@ def tokenize_text(cleaned_txt: str, vocab: dict, lang: str) -> str:
     Returns:
         str: tokenized text tokens separated by |
     """
-    if lang == "en":
-        # wav2vec2.0
-        cleaned_txt = cleaned_txt.upper()
-    else:
-        # XLS-R
-        cleaned_txt = cleaned_txt.lower()
-
-    tokenized_cleaned_txt = "".join(
-        [c if c in vocab.keys() else "|" for c in cleaned_txt.replace(" ", "|")]
-    )
-
-    if set(tokenized_cleaned_txt) == set("|") or not tokenized_cleaned_txt:
-        return ""
-
-    while "||" in tokenized_cleaned_txt:
-        tokenized_cleaned_txt = tokenized_cleaned_txt.replace("||", "|")
-    if tokenized_cleaned_txt[-1] == "|":
-        tokenized_cleaned_txt = tokenized_cleaned_txt[:-1]
-    if tokenized_cleaned_txt[0] == "|":
-        tokenized_cleaned_txt = tokenized_cleaned_txt[1:]
-
-    return tokenized_cleaned_txt
+    return TextTokenizer.for_vocab(vocab, lang).tokenize(cleaned_txt)
@@ -45,7 +45,10 @@ python ${SEGAUGMENT_ROOT}/src/audio_alignment/get_word_segments.py \
     -wav $wav_dir \
     -txt $original_src \
     -yaml $original_yaml \
-    -out $forced_alignment_dir
+    -out $forced_alignment_dir \
+    ${ALIGNMENT_SOCKET:+--socket $ALIGNMENT_SOCKET} \
+    ${ALIGNMENT_STORE_DIR:+--alignment-store-dir $ALIGNMENT_STORE_DIR} \
+    ${TEXT_CACHE_DIR:+--text-cache-dir $TEXT_CACHE_DIR}
 
 ### TEXT ALIGNMENT
 